@@ -0,0 +1,108 @@
+import copy
+
+import numpy as np
+import pandas as pd
+
+from district import seat_divisors
+
+
+def _model_copy(norway):
+    model = copy.copy(norway)
+    model.args = copy.copy(norway.args)
+    return model
+
+
+def _apportionments(norway, lower, upper):
+    # The district seat distributions met going from lower to upper area
+    # multiplier, as (start of the interval, multiplier it was calculated at,
+    # seats per district). Every district's score area*multiplier + population
+    # is a line in the multiplier, and so is every quotient. The seats only
+    # change where the lowest winning quotient (the last seat of a district)
+    # falls below the highest losing one (the next seat of another district),
+    # so the next breakpoint is the first such crossing, and the seats are
+    # calculated again just past it.
+    model = _model_copy(norway)
+    names = list(norway.populations)
+    areas = np.array([norway.dist_areas[name] for name in names], dtype = float)
+    populations = np.array([norway.populations[name] for name in names], dtype = float)
+    if norway.args.usadist:
+        method, first_seats = "hunthill", 1 # the two extra seats of every district don't take part
+    else:
+        method, first_seats = ("dhondt" if norway.args.method == "dhondt" else "stlague"), 0
+    others = ~np.eye(len(names), dtype = bool)
+
+    def seats_at(multiplier):
+        model.args.areamultiplier = multiplier
+        model._calculate_seat_distribution(num_seats = model._num_seats)
+        return np.array([model.total_seats[name] for name in names])
+
+    def next_breakpoint(seats, multiplier):
+        own_seats = seats - (2 if norway.args.usadist else 0)
+        last_divisors = seat_divisors(np.maximum(own_seats - 1, 0), method = method, initial_divisor = 1)
+        next_divisors = seat_divisors(own_seats, method = method, initial_divisor = 1)
+        # last quotient of district i minus next quotient of district j, as slope*multiplier + intercept
+        slopes = areas[:, None]/last_divisors[:, None] - areas/next_divisors
+        intercepts = populations[:, None]/last_divisors[:, None] - populations/next_divisors
+        with np.errstate(divide = "ignore", invalid = "ignore"):
+            crossings = -intercepts/slopes
+        falling = (own_seats > first_seats)[:, None] & others & (slopes < 0) & (crossings > multiplier)
+        return np.min(crossings[falling], initial = np.inf)
+
+    multiplier = lower
+    apportionments = [(lower, lower, seats_at(lower))]
+    while True:
+        breakpoint = next_breakpoint(apportionments[-1][2], multiplier)
+        if breakpoint >= upper:
+            return names, apportionments
+        multiplier = breakpoint + max(1e-9, 1e-9*abs(breakpoint))
+        seats = seats_at(multiplier)
+        if not np.array_equal(seats, apportionments[-1][2]):
+            apportionments.append((breakpoint, multiplier, seats))
+
+
+def area_breakpoints(norway, lower = 0.0, upper = 5.0):
+    # The seats per district for every interval of area multipliers between
+    # lower and upper with the same seat distribution, with the districts
+    # that gain and lose a seat where each interval starts.
+    names, apportionments = _apportionments(norway, lower, upper)
+    seats = np.array([district_seats for _, _, district_seats in apportionments])
+    changes = np.diff(seats, axis = 0)
+    table = pd.DataFrame(seats, columns = names)
+    table.insert(0, "Fra", [start for start, _, _ in apportionments])
+    table.insert(1, "Til", [start for start, _, _ in apportionments[1:]] + [upper])
+    table.insert(2, "Vinner", [""] + [", ".join(np.array(names)[change > 0]) for change in changes])
+    table.insert(3, "Taper", [""] + [", ".join(np.array(names)[change < 0]) for change in changes])
+    return table
+
+
+def area_seats(norway, lower = 0.0, upper = 5.0):
+    # The seats per party for every area multiplier between lower and upper,
+    # with one row per interval with the same seats. The party seats are
+    # calculated once for every district seat distribution, on a copy of the model.
+    names, apportionments = _apportionments(norway, lower, upper)
+    model = _model_copy(norway)
+    party_seats = {}
+    rows = []
+    for _, multiplier, seats in apportionments:
+        key = seats.tobytes()
+        if key not in party_seats:
+            model.args.areamultiplier = multiplier
+            model._calculate_seat_distribution(num_seats = model._num_seats)
+            model.total_votes = np.sum(model.cube.votes)
+            model._calculate_blanks()
+            model._calculate_direct_seats(method = model.dist_method)
+            model._calculate_leveling_seats_parties(num_seats = model._num_seats)
+            party_seats[key] = {norway.party_names[party]: values[0]
+                                for party, values in model.distribution_with_leveling.items()}
+        rows.append(party_seats[key])
+
+    seats = pd.DataFrame(rows).fillna(0).astype(int)
+    seats = seats[seats.max(axis = 0).sort_values(ascending = False, kind = "stable").index]
+
+    # neighbouring intervals with the same party seats are joined
+    starts = np.flatnonzero(np.append(True, np.any(np.diff(seats.to_numpy(), axis = 0) != 0, axis = 1)))
+    bounds = [start for start, _, _ in apportionments] + [upper]
+    table = seats.iloc[starts].reset_index(drop = True)
+    table.insert(0, "Fra", [bounds[start] for start in starts])
+    table.insert(1, "Til", [bounds[end] for end in np.append(starts[1:], len(seats))])
+    return table
@@ -0,0 +1,251 @@
+import argparse
+import contextlib
+import itertools
+import json
+import os
+import platform
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from district import District, apportion
+from election import FIGURE_NAMES, Norway, parse_args
+from votecube import VoteCube
+
+
+def synthetic_results(num_districts = 19, num_parties = 20, num_stations = 100, seed = 0):
+    # Results in the same layout as the partydist files: one row per party and
+    # polling station, num_stations stations in each district, grouped into
+    # municipalities of ten. The national party strengths vary a little
+    # between districts, and the last party is the blank votes.
+    rng = np.random.default_rng(seed)
+    party_codes = [f"P{party:02d}" for party in range(1, num_parties)] + ["BLANKE"]
+    strengths = rng.dirichlet(np.full(num_parties, 0.8))
+    district_strengths = rng.dirichlet(strengths*50 + 0.01, size = num_districts)
+
+    eligibles = rng.integers(200, 3000, size = (num_districts, num_stations))
+    turnout = rng.binomial(eligibles, 0.77)
+    votes = rng.multinomial(turnout, district_strengths[:, None, :]) # districts x stations x parties
+
+    district_ids, station_ids, party_ids = np.indices(votes.shape).reshape(3, -1)
+    district_names = np.array([f"Distrikt {district + 1:03d}" for district in range(num_districts)])
+    municipalities = district_ids*((num_stations + 9)//10) + station_ids//10
+    return pd.DataFrame({"Fylkenummer": district_ids + 1,
+                         "Fylkenavn": district_names[district_ids],
+                         "Kommunenummer": municipalities + 1,
+                         "Kommunenavn": np.char.add("Kommune ", (municipalities + 1).astype(str)),
+                         "Stemmekretsnummer": station_ids + 1,
+                         "Partikode": np.array(party_codes)[party_ids],
+                         "Partinavn": np.char.add("Parti ", np.array(party_codes)[party_ids]),
+                         "Antall stemmeberettigede": eligibles[district_ids, station_ids],
+                         "Antall stemmer totalt": votes.ravel()})
+
+
+def synthetic_election(args, results, seed = 0):
+    # a Norway with the districts of the synthetic results, their populations
+    # and areas drawn at random and placed on a grid on the map
+    rng = np.random.default_rng(seed)
+    cube = VoteCube.from_results(results)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        norway = Norway(args, cube = cube)
+    names = cube.district_names
+    columns = int(np.ceil(np.sqrt(len(names))))
+    norway.populations = dict(zip(names, (cube.eligibles*rng.uniform(1.1, 1.4, len(names))).astype(int).tolist()))
+    norway.dist_areas = dict(zip(names, rng.integers(500, 40000, len(names)).tolist()))
+    norway.locations = {name: [-5 + 10*(i%columns)/columns, -3 + 9*(i//columns)/columns] for i, name in enumerate(names)}
+    norway.district_id_by_name = {name: i + 1 for i, name in enumerate(names)}
+    norway.district_name_by_id = {i + 1: name for i, name in enumerate(names)}
+    colors = rng.integers(0, 256, size = (len(cube.party_codes), 3))
+    norway.parties_left_to_right = {party: "#{:02x}{:02x}{:02x}".format(*color) for party, color in zip(cube.party_codes, colors)}
+    norway.parties_actual_distri = {}
+    return norway
+
+
+def write_synthetic_usa(folder, num_states = 51, num_counties = 60, seed = 0):
+    # the three files USA reads, under folder/usa
+    rng = np.random.default_rng(seed)
+    os.makedirs(os.path.join(folder, "usa"), exist_ok = True)
+    states = [f"State {state + 1:02d}" for state in range(num_states)]
+    candidates = ["Joe Biden", "Donald Trump", "Jo Jorgensen"]
+    shares = rng.dirichlet([20, 20, 1], size = num_states)
+    turnout = rng.integers(1000, 200000, size = (num_states, num_counties))
+    votes = rng.multinomial(turnout, shares[:, None, :])
+    state_ids, county_ids, candidate_ids = np.indices(votes.shape).reshape(3, -1)
+    pd.DataFrame({"state": np.array(states)[state_ids],
+                  "county": np.char.add("C", county_ids.astype(str)),
+                  "candidate": np.array(candidates)[candidate_ids],
+                  "party": "X",
+                  "total_votes": votes.ravel(),
+                  "won": False}).to_csv(os.path.join(folder, "usa", "president_county_candidate.csv"), index = False)
+    pd.DataFrame({"State": states,
+                  "Population": np.sum(turnout, axis = 1)*2,
+                  "Area": rng.integers(1000, 600000, num_states)}).to_csv(os.path.join(folder, "usa", "poparea.csv"), index = False)
+    pd.DataFrame({"name": states,
+                  "latitude": rng.uniform(25, 49, num_states).round(3),
+                  "longitude": rng.uniform(-124, -67, num_states).round(3)}).to_csv(os.path.join(folder, "usa", "states_locations.csv"), index = False)
+
+
+def measure(function, repeats = 5, setup = None):
+    # median wall time over the repeats, and the peak memory of one more run
+    # under tracemalloc (kept apart so tracing doesn't slow down the timings)
+    durations = []
+    for _ in range(repeats):
+        state = setup() if setup is not None else None
+        start_time = time.perf_counter()
+        function(state)
+        durations.append(time.perf_counter() - start_time)
+
+    state = setup() if setup is not None else None
+    tracemalloc.start()
+    function(state)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return statistics.median(durations), peak
+
+
+def benchmark_size(args, num_districts, num_parties, num_seats, num_stations, repeats = 5, plots = False, usa = True, seed = 0):
+    # (stage, time, amount of work, unit, peak memory) for every stage on one synthetic election
+    rows = []
+    results = synthetic_results(num_districts, num_parties, num_stations, seed = seed)
+    num_rows = len(results)
+    district_seats = max(num_seats//num_districts, 1)
+
+    def add(stage, work, unit, function, setup = None, stage_repeats = repeats):
+        duration, peak = measure(function, repeats = stage_repeats, setup = setup)
+        rows.append((stage, duration, work, unit, peak))
+
+    add("VoteCube.from_results", num_rows, "rader", lambda _: VoteCube.from_results(results))
+
+    cube = VoteCube.from_results(results)
+    national_votes = np.sum(cube.votes, axis = 0).tolist()
+    for method in ("stlague", "dhondt", "hunthill", "fptp"):
+        def district_method(_, method = method):
+            district = District(num_seats, method = method, hh_threshold = 0)
+            for party, votes in enumerate(national_votes):
+                district.add_votes(party, votes)
+            district.calculate()
+        add(f"District.{method}", num_seats, "mandater", district_method)
+    add("apportion (alle distrikter)", district_seats*num_districts, "mandater",
+        lambda _: apportion(cube.votes, district_seats))
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        norway = synthetic_election(args, results, seed = seed)
+        norway.calculate(dist_method = args.method, num_seats = num_seats)
+        add("_calculate_seat_distribution", num_districts, "distrikter",
+            lambda _: norway._calculate_seat_distribution(num_seats = num_seats))
+        add("_calculate_direct_seats", num_seats, "mandater",
+            lambda _: norway._calculate_direct_seats(method = args.method))
+        add("_calculate_leveling_seats_parties", num_parties, "partier",
+            lambda _: norway._calculate_leveling_seats_parties(num_seats = num_seats))
+        add("_calculate_leveling_seats_districts", num_districts, "distrikter",
+            lambda _: norway._calculate_leveling_seats_districts())
+        add("Norway.calculate", num_seats, "mandater",
+            lambda _: norway.calculate(dist_method = args.method, num_seats = num_seats))
+
+        # the remap NewCountiesNorway does, with every two districts merged into one
+        mapping = {name: f"Sammenslått {i//2 + 1:03d}" for i, name in enumerate(cube.district_names)}
+        def merge_and_calculate(election):
+            election.merge_districts(mapping)
+            election.calculate(dist_method = args.method, num_seats = num_seats)
+        add("merge_districts + calculate", num_districts, "distrikter", merge_and_calculate,
+            setup = lambda: synthetic_election(args, results, seed = seed))
+
+        if plots:
+            import matplotlib
+            matplotlib.use("Agg")
+            with tempfile.TemporaryDirectory() as folder:
+                norway.args.folder = folder
+                norway._prepare_plots()
+                for name in FIGURE_NAMES:
+                    add(f"plot {name}", num_seats, "mandater", lambda _, name = name: norway.plot_figure(name),
+                        stage_repeats = 1)
+
+        if usa:
+            from usa import USA
+            with tempfile.TemporaryDirectory() as folder:
+                write_synthetic_usa(folder, num_states = num_districts, num_counties = num_stations, seed = seed)
+                working_folder = os.getcwd()
+                os.chdir(folder)
+                try:
+                    add("USA (lese inn + calculate)", 538, "mandater",
+                        lambda _: USA(args).calculate(dist_method = args.method))
+                finally:
+                    os.chdir(working_folder)
+
+    table = pd.DataFrame(rows, columns = ["Steg", "Tid (ms)", "Arbeid", "Enhet", "Minne (MB)"])
+    table["Per sekund"] = table["Arbeid"]/table["Tid (ms)"]
+    table["Tid (ms)"] *= 1000
+    table["Minne (MB)"] /= 1024**2
+    table.insert(0, "Størrelse", f"{num_districts}d/{num_parties}p/{num_seats}m/{num_stations}k")
+    return table
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Time every stage of the calculation on synthetic elections. Other arguments are passed on to election.py")
+    parser.add_argument("-d", "--districts",
+                        help = "Number of districts, several values give one run for each (default 19)",
+                        nargs = "+", default = [19], type = int)
+    parser.add_argument("-p", "--parties",
+                        help = "Number of parties, including the blank votes (default 20)",
+                        nargs = "+", default = [20], type = int)
+    parser.add_argument("--seats", # -m and -n are passed on to election.py as --method and --newcounties
+                        help = "Number of seats (default 169)",
+                        nargs = "+", default = [169], type = int)
+    parser.add_argument("-k", "--stations",
+                        help = "Number of polling stations per district (default 100)",
+                        nargs = "+", default = [100], type = int)
+    parser.add_argument("--repeats",
+                        help = "Number of timed runs of each stage, the median is shown (default 5)",
+                        default = 5, type = int)
+    parser.add_argument("--seed",
+                        help = "Seed for the synthetic elections (default 0)",
+                        default = 0, type = int)
+    parser.add_argument("--plots",
+                        help = "Also time the four figures (slow)",
+                        action = "store_true")
+    parser.add_argument("--nousa",
+                        help = "Leave out the USA calculation",
+                        action = "store_true")
+    parser.add_argument("--json",
+                        help = "Save the results to FILE, to compare against later",
+                        default = None, metavar = "FILE", type = str)
+    parser.add_argument("--compare",
+                        help = "Show the speedup against results saved earlier with --json",
+                        default = None, metavar = "FILE", type = str)
+    bench_args, election_argv = parser.parse_known_args()
+    args = parse_args(election_argv)
+
+    tables = []
+    for num_districts, num_parties, num_seats, num_stations in itertools.product(bench_args.districts, bench_args.parties,
+                                                                                  bench_args.seats, bench_args.stations):
+        tables.append(benchmark_size(args, num_districts, num_parties, num_seats, num_stations,
+                                     repeats = bench_args.repeats, plots = bench_args.plots,
+                                     usa = not bench_args.nousa, seed = bench_args.seed))
+    table = pd.concat(tables, ignore_index = True)
+
+    if bench_args.compare:
+        with open(bench_args.compare, encoding = "utf-8") as infile:
+            earlier = pd.DataFrame(json.load(infile)["results"])
+        earlier = earlier.set_index(["Størrelse", "Steg"])["Tid (ms)"]
+        times_before = [earlier.get(key, np.nan) for key in zip(table["Størrelse"], table["Steg"])]
+        table["Før (ms)"] = times_before
+        table["Raskere"] = table["Før (ms)"]/table["Tid (ms)"]
+
+    print(f"Python {platform.python_version()}, numpy {np.__version__}, pandas {pd.__version__}, "
+          f"metode {args.method}, frø {bench_args.seed}, median av {bench_args.repeats}")
+    with pd.option_context("display.float_format", "{:.3f}".format, "display.width", 200):
+        print(table.drop(columns = ["Arbeid"]).to_string(index = False))
+
+    if bench_args.json:
+        with open(bench_args.json, "w", encoding = "utf-8") as outfile:
+            json.dump({"python": platform.python_version(), "numpy": np.__version__, "method": args.method,
+                       "seed": bench_args.seed, "repeats": bench_args.repeats,
+                       "results": table.to_dict(orient = "records")}, outfile, indent = 1, ensure_ascii = False)
+
+
+if __name__ == "__main__":
+    main()
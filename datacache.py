@@ -0,0 +1,118 @@
+import glob
+import hashlib
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+CACHE_FOLDER = ".datacache"
+CACHE_VERSION = 1
+
+
+def _content_hash(filename, reader_key):
+    file_hash = hashlib.blake2b(digest_size = 16)
+    file_hash.update(f"{CACHE_VERSION};{reader_key};".encode("utf-8"))
+    with open(filename, "rb") as infile:
+        for block in iter(lambda: infile.read(1 << 20), b""):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+
+_file_hashes = {}
+
+
+def file_hash(filename):
+    # hash of the contents of a file, worked out again only when the file changes
+    stat = os.stat(filename)
+    key = (os.path.abspath(filename), stat.st_mtime_ns, stat.st_size)
+    if key not in _file_hashes:
+        _file_hashes[key] = _content_hash(filename, "file")
+    return _file_hashes[key]
+
+
+def _cache_prefix(filename, reader_key):
+    # the cached files of one reader of one file start with the same name, so older versions can be found
+    folder = os.path.join(os.path.dirname(os.path.abspath(filename)), CACHE_FOLDER)
+    reader_hash = hashlib.blake2b(reader_key.encode("utf-8"), digest_size = 4).hexdigest()
+    return folder, f"{os.path.basename(filename)}-{reader_hash}-"
+
+
+def _save_frame(path, frame):
+    # every column as a typed array, text columns as integer codes into their unique values
+    arrays = {"columns": np.array(frame.columns, dtype = str),
+              "dtypes": np.array([str(dtype) for dtype in frame.dtypes], dtype = str)}
+    for i, column in enumerate(frame.columns):
+        values = frame[column]
+        if pd.api.types.is_numeric_dtype(values) or pd.api.types.is_bool_dtype(values):
+            arrays[f"values_{i}"] = values.to_numpy()
+        else:
+            codes, categories = pd.factorize(values)
+            arrays[f"codes_{i}"] = codes.astype(np.int32)
+            arrays[f"categories_{i}"] = np.array(categories, dtype = str)
+    # written to a temporary file first, so other processes never read half a file
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    with open(temporary_path, "wb") as outfile:
+        np.savez(outfile, **arrays)
+    os.replace(temporary_path, path)
+
+
+def _load_frame(path):
+    columns = {}
+    with np.load(path, allow_pickle = False) as data:
+        dtypes = data["dtypes"]
+        for i, column in enumerate(data["columns"]):
+            if f"values_{i}" in data:
+                columns[column] = data[f"values_{i}"]
+            else:
+                categories = pd.Categorical.from_codes(data[f"codes_{i}"], data[f"categories_{i}"])
+                columns[column] = pd.Series(categories).astype(dtypes[i])
+    return pd.DataFrame(columns)
+
+
+def _remove_stale(filename, prefix, path):
+    # older versions from this reader, and files named {file}-{key}.npz from before the reader was part of the name
+    folder = os.path.dirname(path)
+    basename = os.path.basename(filename)
+    stale_paths = glob.glob(os.path.join(folder, f"{glob.escape(prefix)}*.npz"))
+    stale_paths += [stale_path for stale_path in glob.glob(os.path.join(folder, f"{glob.escape(basename)}-*.npz"))
+                    if re.fullmatch(r"[0-9a-f]{32}", os.path.basename(stale_path)[len(basename) + 1:-len(".npz")])]
+    for stale_path in stale_paths:
+        if stale_path != path:
+            try:
+                os.remove(stale_path)
+            except OSError:
+                pass # removed by another process, or a read-only folder
+
+
+def _cached_frame(filename, reader_key, read):
+    key = _content_hash(filename, reader_key)
+    folder, prefix = _cache_prefix(filename, reader_key)
+    path = os.path.join(folder, f"{prefix}{key}.npz")
+    if os.path.exists(path):
+        try:
+            frame = _load_frame(path)
+        except Exception:
+            pass # a damaged or outdated file is read again and replaced
+        else:
+            _remove_stale(filename, prefix, path)
+            return frame
+
+    frame = read()
+    try:
+        os.makedirs(folder, exist_ok = True)
+        _save_frame(path, frame)
+    except OSError:
+        return frame # the cache is only an optimization, so a read-only folder is fine
+    _remove_stale(filename, prefix, path)
+    return frame
+
+
+def read_csv_cached(filename, delimiter = ";", decimal = ","):
+    # pd.read_csv, parsed once per version of the file and then loaded from the cache
+    return _cached_frame(filename, f"csv{delimiter}{decimal}",
+                         lambda: pd.read_csv(filename, delimiter = delimiter, decimal = decimal))
+
+
+def read_excel_cached(filename):
+    return _cached_frame(filename, "excel", lambda: pd.read_excel(filename))
@@ -1,5 +1,9 @@
+import heapq
+
 import numpy as np
 
+from instrument import tracer
+
 
 class District:
     def __init__(self, seats, initial_divisor = 1.4, method = "stlague",
@@ -38,48 +42,13 @@ class District:
         self._names.pop(idx)
 
     def stlague(self):
-        if len(self._votes) == 0:
-            return {}
-        num_parties = len(self._votes)
-        awarded_seats = np.zeros(num_parties, dtype = np.int)
-        votes_array = np.array(self._votes)
-        divisor_array = np.full(num_parties, self._initial_divisor)
-
-        while np.sum(awarded_seats) < self._seats:
-            scores = votes_array/divisor_array
-            next_seat = np.argmax(scores)
-            awarded_seats[next_seat] += 1
-            divisor_array[next_seat] = awarded_seats[next_seat]*2 + 1
-
-        final_results = {}
-
-        for name, seats in zip(self._names, awarded_seats):
-            final_results[name] = seats
-
-        return final_results
+        return self._highest_averages(lambda seats: seats*2 + 1)
 
     def dhondt(self):
-        if len(self._votes) == 0:
-            return {}
-        num_parties = len(self._votes)
-        awarded_seats = np.zeros(num_parties, dtype = np.int)
-        votes_array = np.array(self._votes)
-        divisor_array = np.full(num_parties, self._initial_divisor)
-
-        while np.sum(awarded_seats) < self._seats:
-            scores = votes_array/divisor_array
-            next_seat = np.argmax(scores)
-            awarded_seats[next_seat] += 1
-            divisor_array[next_seat] = awarded_seats[next_seat] + 1
-
-        final_results = {}
-
-        for name, seats in zip(self._names, awarded_seats):
-            final_results[name] = seats
-
-        return final_results
+        return self._highest_averages(lambda seats: seats + 1)
 
     def fptp(self):
+        tracer.count("District.calculate")
         if len(self._votes) == 0:
             return {}
         winner_ind = np.argmax(self._votes)
@@ -102,20 +71,42 @@ class District:
             tmp_votes.pop(idx)
             tmp_names.pop(idx)
 
+        return self._highest_averages(lambda seats: np.sqrt(seats*(seats + 1)),
+                                      initial_seats = self._initial_seats,
+                                      first_divisor = np.sqrt(self._initial_seats*(self._initial_seats + 1)),
+                                      finite_scores = True)
+
+    def _highest_averages(self, divisor, initial_seats = 0, first_divisor = None, finite_scores = False):
+        # Shared engine for the divisor methods. Every party keeps its current
+        # quotient in a heap, so each seat costs one heap replace instead of a
+        # pass over all parties. Ties go to the party added first, as np.argmax
+        # did in the old seat-by-seat loop.
+        tracer.count("District.calculate")
         if len(self._votes) == 0:
             return {}
+        if first_divisor is None:
+            first_divisor = self._initial_divisor
+
         num_parties = len(self._votes)
-        awarded_seats = np.full(num_parties, self._initial_seats)
-        votes_array = np.array(self._votes)
-        divisor_array = np.full(num_parties, np.sqrt(self._initial_seats*(self._initial_seats + 1)))
-
-        while np.sum(awarded_seats) < self._seats:
-            scores = votes_array/divisor_array
-            scores = np.nan_to_num(scores)
-            next_seat = np.argmax(scores)
-            awarded_seats[next_seat] += 1
-            awarded_seats_this = awarded_seats[next_seat]
-            divisor_array[next_seat] = np.sqrt(awarded_seats_this*(awarded_seats_this + 1))
+        awarded_seats = [initial_seats]*num_parties
+        votes_array = np.array(self._votes, dtype = float)
+
+        def score(idx, div):
+            quotient = votes_array[idx]/div
+            if finite_scores:
+                quotient = np.nan_to_num(quotient)
+            return -float(quotient)
+
+        queue = [(score(idx, first_divisor), idx) for idx in range(num_parties)]
+        heapq.heapify(queue)
+
+        seats_left = self._seats - initial_seats*num_parties
+        tracer.count("District seat iterations", max(seats_left, 0))
+        while seats_left > 0:
+            idx = queue[0][1]
+            awarded_seats[idx] += 1
+            heapq.heapreplace(queue, (score(idx, divisor(awarded_seats[idx])), idx))
+            seats_left -= 1
 
         final_results = {}
 
@@ -131,3 +122,135 @@ class District:
     @seats.setter
     def seats(self, val):
         self._seats = val
+
+
+def seat_divisors(seats, method = "stlague", initial_divisor = 1.4):
+    # The divisor a party holding the given number of seats has its votes
+    # divided by when competing for its next seat
+    seats = np.asarray(seats)
+    method = method.lower()
+    if method in ("hunthill", "hh"):
+        return np.sqrt(seats*(seats + 1))
+    if method == "fptp":
+        return np.ones(seats.shape)
+    if method == "dhondt":
+        return np.where(seats == 0, initial_divisor, seats + 1)
+    return np.where(seats == 0, initial_divisor, seats*2 + 1)
+
+
+def priority_sequence(votes, num_seats, method = "stlague", initial_divisor = 1.4, initial_seats = 0):
+    # The first num_seats seats District.calculate would hand out, as the
+    # party and the quotient of every seat in the order they are won. A party
+    # can't win a seat before its previous one, so every quotient is capped by
+    # the ones before it, and ties go to the party added first. The first n
+    # entries are the seats of an n seat district, on top of the initial_seats
+    # every party starts with.
+    votes = np.asarray(votes, dtype = float)
+    num_parties = len(votes)
+    if num_parties == 0 or num_seats <= 0:
+        return np.zeros(0, dtype = int), np.zeros(0)
+    divisors = seat_divisors(np.arange(num_seats) + initial_seats, method = method, initial_divisor = initial_divisor)
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+        quotients = np.minimum.accumulate(votes[:, None]/divisors, axis = 1).ravel()
+
+    # only the quotients at or above the lowest winning one need sorting
+    candidates = np.arange(len(quotients))
+    if len(quotients) > num_seats:
+        cutoff = -np.partition(-quotients, num_seats - 1)[num_seats - 1]
+        candidates = np.flatnonzero(quotients >= cutoff)
+    order = candidates[np.argsort(-quotients[candidates], kind = "stable")][:num_seats]
+    return order//num_seats, quotients[order]
+
+
+def cumulative_seats(order, num_parties):
+    # the seats of every party after each number of seats handed out in order,
+    # as (len(order) + 1) x parties, so row n is the result for n seats
+    table = np.zeros((len(order) + 1, num_parties), dtype = int)
+    table[np.arange(1, len(order) + 1), order] = 1
+    return np.cumsum(table, axis = 0)
+
+
+def apportion(votes, seats, method = "stlague", initial_divisor = 1.4,
+              initial_seats = 1, hh_threshold = 4, present = None):
+    # Batched counterpart to District.calculate. votes has parties along the
+    # last axis and any number of leading axes (districts, samples, ...), seats
+    # gives the number of seats for each row. Parties not running in a row are
+    # marked False in present. Returns an integer seat array shaped like votes.
+    votes = np.asarray(votes, dtype = float)
+    seats = np.broadcast_to(np.asarray(seats, dtype = int), votes.shape[:-1])
+    tracer.count("apportion")
+    tracer.count("apportion rows", int(np.prod(votes.shape[:-1])))
+    if present is None:
+        present = np.ones(votes.shape, dtype = bool)
+    else:
+        present = np.broadcast_to(np.asarray(present, dtype = bool), votes.shape)
+    method = method.lower()
+    num_parties = votes.shape[-1]
+
+    if method == "fptp":
+        winners = np.argmax(np.where(present, votes, -np.inf), axis = -1)
+        awarded_seats = np.zeros(votes.shape, dtype = int)
+        np.put_along_axis(awarded_seats, winners[..., None], seats[..., None], axis = -1)
+        return awarded_seats*np.any(present, axis = -1, keepdims = True)
+
+    hunthill = method in ("hunthill", "hh")
+    if hunthill:
+        sum_votes = np.sum(np.where(present, votes, 0), axis = -1, keepdims = True)
+        with np.errstate(divide = "ignore", invalid = "ignore"):
+            present = present & ~(votes/sum_votes*100 < hh_threshold)
+        awarded_seats = np.where(present, initial_seats, 0)
+    else:
+        awarded_seats = np.zeros(votes.shape, dtype = int)
+
+    seats_left = seats - np.sum(awarded_seats, axis = -1)
+    max_seats_left = int(np.max(seats_left, initial = 0))
+    if max_seats_left <= 0:
+        return awarded_seats
+
+    # every quotient a party could win with, in the order the sequential
+    # method would hand them out for that party
+    steps = np.arange(max_seats_left)
+    if hunthill:
+        steps = steps + initial_seats
+    divisors = seat_divisors(steps, method = method, initial_divisor = initial_divisor)
+
+    # rows with the same number of seats are handled together, so each group
+    # only needs its own number of quotients per party and a single cutoff rank
+    for group_seats in np.unique(seats_left[seats_left > 0]):
+        tracer.count("apportion seat groups")
+        rows = seats_left == group_seats
+        with np.errstate(divide = "ignore", invalid = "ignore"):
+            quotients = votes[rows][..., None]/divisors[:group_seats]
+        if hunthill:
+            quotients = np.nan_to_num(quotients)
+        # a party can't win a seat before its previous one, so every quotient
+        # is capped by the ones before it (a first divisor above the second
+        # would otherwise let a party skip its first seat)
+        quotients = np.minimum.accumulate(quotients, axis = -1)
+        group_present = present[rows]
+        quotients[~group_present] = -np.inf
+        flat_quotients = quotients.reshape(len(quotients), -1)
+
+        # the lowest winning quotient in each row, found with a partial sort
+        cutoff = -np.partition(-flat_quotients, group_seats - 1, axis = -1)[:, group_seats - 1]
+        cutoff = cutoff[:, None, None]
+
+        won = quotients >= cutoff
+        won &= group_present[..., None]
+
+        # where several quotients tie at the cutoff, they are handed out in
+        # party order until the seats run out, matching District.calculate
+        crowded = np.sum(won, axis = (-2, -1)) > group_seats
+        if np.any(crowded):
+            crowded_quotients = quotients[crowded]
+            crowded_cutoff = cutoff[crowded]
+            above = crowded_quotients > crowded_cutoff
+            tied = won[crowded] & ~above
+            tied = tied.reshape(len(tied), -1)
+            room = group_seats - np.sum(above, axis = (-2, -1))
+            tied &= np.cumsum(tied, axis = -1) <= room[:, None]
+            won[crowded] = above | tied.reshape(above.shape)
+
+        awarded_seats[rows] += np.sum(won, axis = -1)
+
+    return awarded_seats
@@ -1,42 +1,59 @@
 import argparse
+import copy
+import functools
 import os
 import time
 
-import matplotlib.font_manager as font_manager
-import matplotlib.patches as patches
-import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 
-from district import District
+from datacache import read_csv_cached, read_excel_cached
+from district import District, apportion
+from instrument import tracer
+from leveling import assign_leveling_seats, level_parties
+from priority import house_seats
+from votecube import VoteCube
+
+FIGURE_NAMES = ("tinget", "seter", "kart", "blokker") # the figures from plot_results, saved as NAME.png
+RESULTS_FILE = "2021-09-21_partydist_final.csv"
+NEW_COUNTIES_RESULTS_FILE = "2021-09-17_partydist.csv"
+ADJUSTMENTS_FILE = "justeringer.ods"
+# the old electoral districts (the counties before 2020) and their populations
+DISTRICT_POPULATIONS = {"Østfold":            299447,
+                        "Akershus":           675240,
+                        "Oslo":               693494,
+                        "Hedmark":            197920,
+                        "Oppland":            173465,
+                        "Buskerud":           266478,
+                        "Vestfold":           246041,
+                        "Telemark":           173355,
+                        "Aust-Agder":         118273,
+                        "Vest-Agder":         188958,
+                        "Rogaland":           479892,
+                        "Hordaland":          528127,
+                        "Sogn og Fjordane":   108404,
+                        "Møre og Romsdal":    265238,
+                        "Sør-Trøndelag":      334514,
+                        "Nord-Trøndelag":     134188,
+                        "Nordland":           241235,
+                        "Troms Romsa":        167839,
+                        "Finnmark Finnmárku": 75472}
 
 
 class Norway:
-    def __init__(self, args, filename = "2021-09-21_partydist_final.csv", num_leveling_seats = 1):
+    def __init__(self, args, filename = RESULTS_FILE, num_leveling_seats = 1, cube = None):
         self._active_message = False
         self.args = args
-        self.results = pd.read_csv(filename, delimiter = ";")
-        self.total_votes = np.sum(self.results["Antall stemmer totalt"])
-
-        populations = {"Østfold":            299447,
-                       "Akershus":           675240,
-                       "Oslo":               693494,
-                       "Hedmark":            197920,
-                       "Oppland":            173465,
-                       "Buskerud":           266478,
-                       "Vestfold":           246041,
-                       "Telemark":           173355,
-                       "Aust-Agder":         118273,
-                       "Vest-Agder":         188958,
-                       "Rogaland":           479892,
-                       "Hordaland":          528127,
-                       "Sogn og Fjordane":   108404,
-                       "Møre og Romsdal":    265238,
-                       "Sør-Trøndelag":      334514,
-                       "Nord-Trøndelag":     134188,
-                       "Nordland":           241235,
-                       "Troms Romsa":        167839,
-                       "Finnmark Finnmárku": 75472}
+        if cube is None:
+            self.results = read_results(filename)
+            self.cube = VoteCube.from_results(self.results)
+        else:
+            # votes that are already aggregated, like the snapshots in a SnapshotStore
+            self.results = None
+            self.cube = cube
+        self.total_votes = np.sum(self.cube.votes)
+
+        populations = dict(DISTRICT_POPULATIONS)
     
         dist_areas = {"Østfold":            4004,
                       "Akershus":           5669,
@@ -121,7 +138,7 @@ class Norway:
                                  "DEMN": "#7211b0",
                                  }
 
-        all_parties = self.results.Partikode.unique()
+        all_parties = self.cube.party_codes
         for party in all_parties:
             if party not in parties_left_to_right:
                 parties_left_to_right[party] = "#424242"
@@ -148,43 +165,174 @@ class Norway:
         self.num_leveling_seats = num_leveling_seats
         self.add_votes_dict = {}
         self.transfer_votes_dict = {}
+        self.district_mapping = {name: name for name in self.cube.district_names} # district in the results -> electoral district
+        self._calculated = False
 
     def add_votes(self, district, party, votes):
         if not district in self.populations:
             print(f"Attempted to add votes in district {district}, but it doesn't exist.")
         if district in self.add_votes_dict:
             parties_dict = self.add_votes_dict[district]
+            previous_votes = parties_dict.get(party, 0)
             parties_dict[party] = votes
         else:
+            previous_votes = 0
             parties_dict = {party: votes}
 
         self.add_votes_dict[district] = parties_dict
+        if self._calculated:
+            self._update_votes(district, party, votes - previous_votes)
 
     def transfer_votes(self, from_party, to_party):
         self.transfer_votes_dict[from_party] = to_party
+        if self._calculated:
+            # moves votes in every district, so everything is recalculated
+            self.calculate(dist_method = self.dist_method, num_seats = self._num_seats)
+
+    def _update_votes(self, district, party, votes):
+        # Update a calculated election after votes were added for one party
+        # in one district. Only that district's direct seats and the leveling
+        # stages are recalculated.
+        cube = self.cube
+        dis_idx = cube.district_index.get(district)
+        party_idx = cube.party_index.get(party)
+        if dis_idx is None or party_idx is None or party_idx not in cube.district_parties[dis_idx]:
+            return # votes are only added for parties running in the district
+        if party == "BLANKE" or self.transfer_votes_dict:
+            self.calculate(dist_method = self.dist_method, num_seats = self._num_seats)
+            return
+
+        self.direct_votes[dis_idx, self.direct_columns[party]] += votes
+        self.direct_competing_votes[dis_idx][party] += votes
+        self.party_votes_total[party] += votes
+        self.district_votes_distributions[district][party] += votes
+        self.district_votes_distributions_table.at[party, district] += votes
+
+        seats = apportion(self.direct_votes[dis_idx],
+                          self.seats_without_leveling[district],
+                          method = self.dist_method,
+                          initial_divisor = self.args.initialdivisor,
+                          present = self.direct_competing[dis_idx])
+        direct_seats_changed = not np.array_equal(seats, self.direct_seats[dis_idx])
+        self.direct_seats[dis_idx] = seats
+
+        leveling_distribution = self.leveling_distribution
+        self._collect_direct_seats(method = self.dist_method)
+        self._calculate_leveling_seats_parties(num_seats = self._num_seats)
+        if direct_seats_changed or self.leveling_distribution != leveling_distribution:
+            self._calculate_leveling_seats_districts()
+        else:
+            # the rest quotients only depend on the direct seats, so the same districts get the leveling seats
+            for district_name, leveling_party in self.leveling_awards.items():
+                district_distribution = self.district_distributions[district_name]
+                district_distribution[leveling_party] = district_distribution.get(leveling_party, 0) + 1
+        self._make_distribution_table(num_seats = self._num_seats)
+
+    def merge_districts(self, mapping, locations = None):
+        # mapping is old district name -> new district name, districts left out keep their name
+        if locations is None:
+            locations = {}
+        mapping = dict(mapping)
+        unknown = [old_name for old_name in mapping if old_name not in self.cube.district_index]
+        if unknown:
+            raise ValueError(f"Unknown districts in the merge map: {', '.join(map(str, unknown))}")
+        for old_name in self.populations:
+            mapping.setdefault(old_name, old_name)
+
+        populations = {}
+        dist_areas = {}
+        old_locations = {}
+        for old_name, new_name in mapping.items():
+            populations[new_name] = populations.get(new_name, 0) + self.populations[old_name]
+            dist_areas[new_name] = dist_areas.get(new_name, 0) + self.dist_areas[old_name]
+            old_locations.setdefault(new_name, []).append(self.locations[old_name])
+
+        merged_locations = {}
+        for new_name in locations:
+            if new_name in populations:
+                merged_locations[new_name] = locations[new_name]
+        for new_name, district_locations in old_locations.items():
+            if new_name not in merged_locations:
+                # place the new district in the middle of the ones it replaces
+                merged_locations[new_name] = np.mean(district_locations, axis = 0).tolist()
+
+        add_votes_dict = {}
+        for old_name, parties_dict in self.add_votes_dict.items():
+            merged_dict = add_votes_dict.setdefault(mapping.get(old_name, old_name), {})
+            for party, votes in parties_dict.items():
+                merged_dict[party] = merged_dict.get(party, 0) + votes
+
+        self.populations = populations
+        self.dist_areas = dist_areas
+        self.locations = merged_locations
+        self.add_votes_dict = add_votes_dict
+        self.cube = self.cube.merge(mapping)
+        if self.results is not None:
+            self.results["Fylkenavn"] = self.results["Fylkenavn"].map(lambda name: mapping.get(name, name))
+        self.district_mapping = {name: mapping[district] for name, district in self.district_mapping.items()}
+
+    def update_votes(self, vote_changes, eligible_changes = None):
+        # Apply changes in the counted votes, {(district, party): change}, and
+        # in the eligible voters, {district: change}, with the districts named
+        # as in the results. Unlike add_votes the changes count towards the
+        # national totals. Only the direct seats of the changed districts are
+        # recalculated. Returns False without changing anything if a party is
+        # not running in the district, then the election has to be rebuilt.
+        cube = self.cube
+        vote_cells = []
+        for (district, party), votes in vote_changes.items():
+            dis_idx = cube.district_index.get(self.district_mapping.get(district))
+            party_idx = cube.party_index.get(party)
+            if dis_idx is None or party_idx is None or party_idx not in cube.district_parties[dis_idx]:
+                return False
+            vote_cells.append((dis_idx, party_idx, votes))
+        eligible_cells = []
+        if eligible_changes is not None:
+            for district, eligibles in eligible_changes.items():
+                dis_idx = cube.district_index.get(self.district_mapping.get(district))
+                if dis_idx is None:
+                    return False
+                eligible_cells.append((dis_idx, eligibles))
+
+        changed_districts = set()
+        for dis_idx, party_idx, votes in vote_cells:
+            cube.votes[dis_idx, party_idx] += votes
+            changed_districts.add(dis_idx)
+        for dis_idx, eligibles in eligible_cells:
+            cube.eligibles[dis_idx] += eligibles
+            changed_districts.add(dis_idx)
+
+        if self._calculated and changed_districts:
+            self.total_votes = np.sum(cube.votes)
+            self._calculate_blanks()
+            self._calculate_direct_seats(method = self.dist_method, districts = changed_districts)
+            self._calculate_leveling_seats_parties(num_seats = self._num_seats)
+            self._calculate_leveling_seats_districts()
+            self._make_votes_per_seat_table()
+            self._make_distribution_table(num_seats = self._num_seats)
+        return True
 
     def _calculate_seat_distribution(self, num_seats = 169):
         if self.args.usadist:
-            seat_distribution = District(num_seats - 2*len(self.populations.items()),
-                                         method = "hunthill", initial_seats = 1, hh_threshold = 0)
+            # Huntington-Hill with one seat to start with, and two more for every district
+            scores = {district_name: self.dist_areas[district_name]*self.args.areamultiplier + population
+                      for district_name, population in self.populations.items()}
+            seats = house_seats(list(scores.values()), num_seats - 2*len(scores))
+            self.total_seats = {district_name: int(district_seats) + 2 for district_name, district_seats in zip(scores, seats)}
         else:
             if self.args.method == "dhondt":
                 seat_distribution = District(num_seats, method = "dhondt", initial_divisor = 1)
             else:
                 seat_distribution = District(num_seats, initial_divisor = 1)
 
-        for district_name, population in self.populations.items():
-            area = self.dist_areas[district_name]
-    
-            score = area*self.args.areamultiplier + population
-            seat_distribution.add_votes(district_name, score)
-    
-        # Seat distribution per district name
-        self.total_seats = seat_distribution.calculate()
+            for district_name, population in self.populations.items():
+                area = self.dist_areas[district_name]
 
-        if self.args.usadist:
-            for district_name, seats in self.total_seats.items():
-                self.total_seats[district_name] = seats + 2
+                score = area*self.args.areamultiplier + population
+                seat_distribution.add_votes(district_name, score)
+
+            # Seat distribution per district name
+            self.total_seats = seat_distribution.calculate()
 
         self.seats_without_leveling = {}
         s = 0 # check that the total is num_seats as well
@@ -193,43 +341,41 @@ class Norway:
             self.seats_without_leveling[key] = item - self.num_leveling_seats
         assert s == num_seats # check that the total is num_seats as well
 
-    def _calculate_direct_seats(self, method = "stlague"):
-        results = self.results
+    def _calculate_direct_seats(self, method = "stlague", districts = None):
+        cube = self.cube
         total_seats = self.total_seats
         seats_without_leveling = self.seats_without_leveling
 
         party_votes_total = {}
         party_names = {}
         party_ids = {}
-        distribution = {}
-        district_distributions = {}
         district_votes_distributions = {}
         votes_per_seat = {}
+        competing_votes = [] # votes for the parties competing in each district
+        excluded_parties = [] # parties stopped by the hard limit in each district
+        party_columns = {} # column of each competing party in the votes matrix
+        hardlimit_shares = set() # the national vote shares the hard limit was checked against
 
-        electoral_districts = results.Fylkenavn.unique()
-        for district_name in electoral_districts:
-            results_dis = results[results["Fylkenavn"] == district_name]
-            parties = list(results_dis.Partikode.unique())
-            total_votes_dis = np.sum(results_dis["Antall stemmer totalt"])
+        national_party_votes = np.sum(cube.votes, axis = 0)
+
+        electoral_districts = cube.district_names
+        for dis_idx, district_name in enumerate(electoral_districts):
+            district_votes = cube.votes[dis_idx]
+            total_votes_dis = np.sum(district_votes)
             votes_per_seat[district_name] = [district_name,
                                              np.round(total_votes_dis/total_seats[district_name], 1)]
 
-            district_eligibles = results_dis["Antall stemmeberettigede"].iloc[0]
+            district_eligibles = cube.eligibles[dis_idx]
             participation = total_votes_dis/district_eligibles*100
 
-            electoral_district = District(seats_without_leveling[district_name],
-                                          initial_divisor = self.args.initialdivisor,
-                                          method = method)
-
+            district_competing_votes = {}
             district_votes_distribution = {}
 
-            for party in parties:
-                results_party = results_dis[results_dis["Partikode"] == party]
-                party_name = results_party.Partinavn.unique()
-                assert len(party_name) == 1 # check that only one party name belongs to the party code
-                party_names[party] = party_name[0]
-                party_ids[party_name[0]] = party
-                votes = np.sum(results_party["Antall stemmer totalt"])
+            for party_idx in cube.district_parties[dis_idx]:
+                party = cube.party_codes[party_idx]
+                party_names[party] = cube.party_names[party]
+                party_ids[cube.party_names[party]] = party
+                votes = district_votes[party_idx]
                 if district_name in self.add_votes_dict:
                     if party in self.add_votes_dict[district_name]:
                         votes_add = self.add_votes_dict[district_name][party]
@@ -250,7 +396,7 @@ class Norway:
                             party_votes_total["HJEM"] += couchvoters
                         else:
                             party_votes_total["HJEM"] = couchvoters
-                        electoral_district.add_votes("HJEM", couchvoters)
+                        district_competing_votes["HJEM"] = district_competing_votes.get("HJEM", 0) + couchvoters
                         district_votes_distribution["HJEM"] = couchvoters
 
                 if party in party_votes_total:
@@ -260,44 +406,100 @@ class Norway:
 
                 if party == "BLANKE" and not self.args.blankparty:
                     continue
-                electoral_district.add_votes(party, votes)
+                district_competing_votes[party] = district_competing_votes.get(party, 0) + votes
                 district_votes_distribution[party] = votes
 
+            district_excluded_parties = set()
             if self.args.hardlimit:
                 # stop parties with less than the leveling limit from gaining any seats at all (even direct district seats)
-                for party in parties:
+                for party_idx in cube.district_parties[dis_idx]:
+                    party = cube.party_codes[party_idx]
                     if party == "BLANKE" and not self.args.blankparty:
                         continue
-                    party_votes_total_this = results[results["Partikode"] == party]
-                    party_votes_total_this = party_votes_total_this.sum()
-                    if party_votes_total_this["Antall stemmer totalt"]/(self.total_minus_blanks)*100 < self.args.levelinglimit:
-                        electoral_district.remove_party(party)
+                    national_share = self.vote_share(national_party_votes[party_idx])
+                    hardlimit_shares.add(float(national_share))
+                    if national_share < self.args.levelinglimit:
+                        district_excluded_parties.add(party)
 
             district_votes_distribution["Deltagelse (%)"] = np.round(participation, 2)
-
-            district_distribution = electoral_district.calculate()
-            district_distributions[district_name] = district_distribution
             district_votes_distributions[district_name] = district_votes_distribution
 
-            for party, seats in district_distribution.items():
-                if not seats:
-                    continue
-                if party in distribution:
-                    distribution[party] += seats
-                else:
-                    distribution[party] = seats
+            for party in district_competing_votes:
+                if party not in party_columns:
+                    party_columns[party] = len(party_columns)
+            competing_votes.append(district_competing_votes)
+            excluded_parties.append(district_excluded_parties)
+
+        # apportion the direct seats in every district at once
+        votes_matrix = np.zeros((len(electoral_districts), len(party_columns)))
+        running = np.zeros(votes_matrix.shape, dtype = bool)
+        competing = np.zeros(votes_matrix.shape, dtype = bool)
+        for i, district_competing_votes in enumerate(competing_votes):
+            for party, votes in district_competing_votes.items():
+                votes_matrix[i, party_columns[party]] = votes
+                running[i, party_columns[party]] = True
+                competing[i, party_columns[party]] = party not in excluded_parties[i]
+
+        # with only some districts changed, the seats of the others are kept
+        # (unless the hard limit, which depends on the national votes, is used)
+        rows = np.ones(len(electoral_districts), dtype = bool)
+        seats_matrix = np.zeros(votes_matrix.shape, dtype = int)
+        if districts is not None and not self.args.hardlimit and list(party_columns) == self.direct_parties:
+            rows[:] = False
+            rows[list(districts)] = True
+            seats_matrix = self.direct_seats.copy()
+        district_seats = np.array([seats_without_leveling[district_name] for district_name in electoral_districts])
+        seats_matrix[rows] = apportion(votes_matrix[rows],
+                                       district_seats[rows],
+                                       method = method,
+                                       initial_divisor = self.args.initialdivisor,
+                                       present = competing[rows])
 
         party_names["HJEM"] = "Hjemmesitterne"
 
         self.party_votes_total = party_votes_total
         self.party_names = party_names
         self.party_ids = party_ids
-        self.distribution = distribution
-        self.district_distributions = district_distributions
         self.district_votes_distributions = district_votes_distributions
         self.district_votes_distributions_table = pd.DataFrame(district_votes_distributions).fillna(0)
         self.votes_per_seat = votes_per_seat
         self.electoral_districts = electoral_districts
+        # the direct-seat stage as arrays (districts x parties), for the batched tools
+        self.direct_parties = list(party_columns)
+        self.direct_votes = votes_matrix
+        self.direct_running = running
+        self.direct_competing = competing
+        self.direct_seats = seats_matrix
+        self.direct_columns = party_columns
+        self.direct_competing_votes = competing_votes
+        self.direct_excluded_parties = excluded_parties
+        self.hardlimit_shares = hardlimit_shares
+
+        self._collect_direct_seats(method = method)
+
+    def _collect_direct_seats(self, method = "stlague"):
+        # the direct seats per district and in total, read from the seats matrix
+        distribution = {}
+        district_distributions = {}
+        for i, district_name in enumerate(self.electoral_districts):
+            district_distribution = {}
+            for party in self.direct_competing_votes[i]:
+                if party in self.direct_excluded_parties[i]:
+                    continue
+                seats = int(self.direct_seats[i, self.direct_columns[party]])
+                if not seats and method in ("hunthill", "hh"):
+                    continue # below the Huntington-Hill threshold, so not part of the district
+                district_distribution[party] = seats
+                if not seats:
+                    continue
+                if party in distribution:
+                    distribution[party] += seats
+                else:
+                    distribution[party] = seats
+            district_distributions[district_name] = district_distribution
+
+        self.distribution = distribution
+        self.district_distributions = district_distributions
 
     def _calculate_leveling_seats_parties(self, num_seats = 169):
         party_vote_shares = {}
@@ -314,7 +516,7 @@ class Norway:
                 seats = self.distribution[party]
             else:
                 seats = 0
-            party_percent_of_total = 100*votes/self.total_minus_blanks
+            party_percent_of_total = self.vote_share(votes)
             party_vote_shares[party] = np.round(party_percent_of_total, 2)
         
             if party_percent_of_total >= leveling_seats_limit:
@@ -325,32 +527,9 @@ class Norway:
             else:
                 leveling_seats -= seats
 
-        # initial distribution before removing overrepresented parties
-        if self.args.method == "dhondt":
-            leveling_district = District(leveling_seats, method = "dhondt")
-        else:
-            leveling_district = District(leveling_seats)
-
-        for party, votes in parties_competing_votes.items():
-            leveling_district.add_votes(party, votes)
-
-        leveling_distribution = leveling_district.calculate()
-
-        parties_over = None
-        while parties_over or parties_over is None:
-            parties_over = [] # append parties to the list as we go
-
-            for party, level_seats in leveling_distribution.items():
-                if party in self.distribution:
-                    district_seats = self.distribution[party]
-                else:
-                    district_seats = 0
-                if district_seats >= level_seats: # party is overrepresented (or level)
-                    parties_over.append(party)
-                    leveling_district.remove_party(party)
-                    leveling_district.seats = leveling_district.seats - district_seats # remove this party's allocated seats from the calculation
-
-            leveling_distribution = leveling_district.calculate()
+        # parties keep dropping out of the leveling as long as they already hold as many seats as they would get
+        leveling_method = "dhondt" if self.args.method == "dhondt" else "stlague"
+        leveling_distribution = level_parties(parties_competing_votes, self.distribution, leveling_seats, method = leveling_method)
 
         distribution_with_leveling = {}
 
@@ -375,56 +554,35 @@ class Norway:
         self.party_vote_shares = party_vote_shares
 
     def _calculate_leveling_seats_districts(self):
-        leveling_table = []
         electoral_districts = self.electoral_districts
         seats_without_leveling = self.seats_without_leveling
         leveling_distribution = self.leveling_distribution
         district_distributions = self.district_distributions
         distribution = self.distribution
-        results = self.results
-
-        for district_name in electoral_districts:
-            results_dis = results[results["Fylkenavn"] == district_name]
-            district_votes_total = results_dis["Antall stemmer totalt"].sum()
-            district_votes_total -= results_dis[results_dis["Partikode"] == "BLANKE"]["Antall stemmer totalt"].sum()
-            district_divisor = district_votes_total/seats_without_leveling[district_name]
-            for party, level_seats in leveling_distribution.items():
-                party_district_votes = results_dis[results_dis["Partikode"] == party]
-                party_district_votes = np.sum(party_district_votes["Antall stemmer totalt"])
-                if party in district_distributions[district_name]:
-                    direct_seats_in_district = district_distributions[district_name][party]
-                else:
-                    direct_seats_in_district = 0
-                if self.args.method == "dhondt":
-                    divisor = direct_seats_in_district + 1
-                else:
-                    divisor = direct_seats_in_district*2 + 1
-                rest_quotient = (party_district_votes/divisor)/district_divisor
-                leveling_table.append([rest_quotient, district_name, party])
-        leveling_table = pd.DataFrame(leveling_table)
-        if len(leveling_table) > 0:
-            leveling_table.columns = ["Restkvotient", "Fylke", "Partikode"]
-            leveling_table = leveling_table.sort_values(by = "Restkvotient", ascending = False)
-
-        parties_awarded = {}
-        leveling_awards = {}
+        cube = self.cube
+
+        # rest quotients for every district and every party with leveling seats
+        leveling_parties = list(leveling_distribution)
+        district_ids = [cube.district_index[district_name] for district_name in electoral_districts]
+        district_votes_total = np.sum(cube.votes[district_ids], axis = 1) - cube.party_votes("BLANKE")[district_ids]
+        district_seats = np.array([seats_without_leveling[district_name] for district_name in electoral_districts])
+        party_district_votes = cube.party_votes_matrix(leveling_parties)[district_ids]
+        direct_seats_in_district = np.array([[district_distributions[district_name].get(party, 0)
+                                              for party in leveling_parties]
+                                             for district_name in electoral_districts], dtype = int).reshape(party_district_votes.shape)
+        if self.args.method == "dhondt":
+            divisors = direct_seats_in_district + 1
+        else:
+            divisors = direct_seats_in_district*2 + 1
+        with np.errstate(divide = "ignore", invalid = "ignore"):
+            district_divisors = district_votes_total/district_seats
+            rest_quotients = (party_district_votes/divisors)/district_divisors[:, None]
 
-        for line in leveling_table.iterrows():
-            district = line[1]["Fylke"]
-            party = line[1]["Partikode"]
-            if party in distribution:
-                seats_to_award = leveling_distribution[party] - distribution[party]
-            else:
-                seats_to_award = leveling_distribution[party]
-            if district in leveling_awards:
-                continue
-            if party in parties_awarded:
-                if parties_awarded[party] >= seats_to_award:
-                    continue
-            else:
-                parties_awarded[party] = 0
-            leveling_awards[district] = party
-            parties_awarded[party] += 1
+        seats_to_award = [leveling_distribution[party] - distribution.get(party, 0) for party in leveling_parties]
+
+        leveling_awards = {}
+        for dis_idx, party_idx in assign_leveling_seats(rest_quotients, seats_to_award):
+            leveling_awards[electoral_districts[dis_idx]] = leveling_parties[party_idx]
 
         for district, party in leveling_awards.items():
             if party in district_distributions[district]:
@@ -434,13 +592,22 @@ class Norway:
 
         self.district_distributions = district_distributions
         self.leveling_awards = leveling_awards
+        # the rest quotient tables (districts x leveling parties), for the marginal seat report
+        self.leveling_parties = leveling_parties
+        self.leveling_votes = party_district_votes
+        self.leveling_divisors = divisors
+        self.leveling_district_votes = district_votes_total
+        self.leveling_district_seats = district_seats
+        self.leveling_seats_to_award = seats_to_award
 
     def _calculate_blanks(self):
-        results = self.results
-        blank_votes = results[results["Partikode"] == "BLANKE"][["Fylkenavn", "Antall stemmer totalt"]]
-        num_possible_voters = results[results["Partikode"] == "BLANKE"]["Antall stemmeberettigede"]
-        percent_blanks = blank_votes["Antall stemmer totalt"]/num_possible_voters*100
-        blank_votes["% av stemmeberettigede"] = percent_blanks
+        cube = self.cube
+        with_blanks = [dis_idx for dis_idx, parties in enumerate(cube.district_parties)
+                       if cube.party_index.get("BLANKE") in parties]
+        blanks = cube.party_votes("BLANKE")[with_blanks]
+        blank_votes = pd.DataFrame({"Fylkenavn": [cube.district_names[dis_idx] for dis_idx in with_blanks],
+                                    "Antall stemmer totalt": blanks,
+                                    "% av stemmeberettigede": blanks/cube.eligibles[with_blanks]*100})
         if self.args.couchvoters or self.args.blankparty:
             self.number_of_blanks = 0
         else:
@@ -448,19 +615,28 @@ class Norway:
         self.total_minus_blanks = self.total_votes - self.number_of_blanks
         self.blank_votes = blank_votes
 
+    def vote_share(self, votes):
+        # national vote share in percent, every comparison with the leveling
+        # limit goes through here so the shares round the same way
+        return 100*votes/self.total_minus_blanks
+
     def calculate(self, dist_method = "stlague", num_seats = 169):
-        self._num_seats = num_seats
-        self._calculate_seat_distribution(num_seats = num_seats)
-        self._calculate_blanks()
-        self._message_start("Beregner direktedistribusjon av mandater")
-        self._calculate_direct_seats(method = dist_method)
-        self._message_start("Beregner hvilke partier som får utjevningsmandater")
-        self._calculate_leveling_seats_parties(num_seats = num_seats)
-        self._message_start("Beregner hvilke valgdistrikt som får utjevningsmandater")
-        self._calculate_leveling_seats_districts()
-        self._message_end()
-        self._make_votes_per_seat_table()
-        self._make_distribution_table(num_seats = num_seats)
+        with tracer.span("calculate", "calculate"):
+            self._num_seats = num_seats
+            self.dist_method = dist_method
+            self.total_votes = np.sum(self.cube.votes) # couchvoters are added again by the direct seats
+            self._calculate_seat_distribution(num_seats = num_seats)
+            self._calculate_blanks()
+            self._message_start("Beregner direktedistribusjon av mandater")
+            self._calculate_direct_seats(method = dist_method)
+            self._message_start("Beregner hvilke partier som får utjevningsmandater")
+            self._calculate_leveling_seats_parties(num_seats = num_seats)
+            self._message_start("Beregner hvilke valgdistrikt som får utjevningsmandater")
+            self._calculate_leveling_seats_districts()
+            self._message_end()
+            self._make_votes_per_seat_table()
+            self._make_distribution_table(num_seats = num_seats)
+            self._calculated = True
 
     def _message_start(self, message):
         if self._active_message:
@@ -468,11 +644,13 @@ class Norway:
         self._start_time = time.perf_counter()
         self._message = message
         self._active_message = True
+        tracer.begin(message)
         print(f"{message:60s}  [ wait ]  ", end = "\r")
 
     def _message_end(self):
         print(f"{self._message:60s}  [  ok  ]  ({time.perf_counter() - self._start_time:>7.5f}s)  ")
         self._active_message = False
+        tracer.end()
 
     def _make_distribution_table(self, num_seats = 169):
         display_dict = {}
@@ -517,23 +695,61 @@ class Norway:
         return out_str
 
     def analyze(self):
-        smalldists_results_2021 = pd.read_csv("2021-09-15_partydist_smalldistricts.csv", delimiter = ";")
+        import matplotlib.pyplot as plt
+        from forensics import DIGIT_PROBABILITIES, digit_counts, digit_tests
+        smalldists_results_2021 = read_results("2021-09-15_partydist_smalldistricts.csv")
         # Benford's law analysis
-        leading_digits = []
-        for line in smalldists_results_2021.iterrows():
-            value = line[1]["Antall stemmer totalt"]
-            if value > 0:
-                first_digit = str(value)[0]
-                leading_digits.append(int(first_digit))
-
-        plt.figure()
-        plt.hist(leading_digits, bins = range(1,11))
-        plt.xticks([1, 2, 3, 4, 5, 6, 7, 8, 9])
-        plt.xlabel("Ledende siffer ")
-        plt.ylabel("Antall tilfeller")
-        plt.title("Ledende siffer for antall stemmer ved alle valgkretser i Norge")
+        print("")
+        print("Siffertester av antall stemmer ved alle valgkretser")
+        print(digit_tests(smalldists_results_2021).to_string())
+        print("")
+        print("Kommunene med størst avvik i første siffer")
+        print(digit_tests(smalldists_results_2021, by = "Kommunenavn", min_count = 50).head(20).to_string())
+        print("")
+        print("Partiene med størst avvik i første siffer")
+        print(digit_tests(smalldists_results_2021, by = "Partinavn", min_count = 50).head(20).to_string())
+
+        values = smalldists_results_2021["Antall stemmer totalt"].to_numpy()
+        fig, axes = plt.subplots(1, 3, figsize = (15, 4.5))
+        for ax, position, label in zip(axes, ["first", "second", "last"], ["Ledende siffer", "Andre siffer", "Siste siffer"]):
+            counts = digit_counts(values, position)
+            ax.bar(range(10), counts, label = "Valgkretser")
+            ax.plot(range(10), DIGIT_PROBABILITIES[position]*np.sum(counts), "ko-", label = "Forventet")
+            ax.set_xticks(range(1, 10) if position == "first" else range(10))
+            ax.set_xlabel(label)
+            ax.set_ylabel("Antall tilfeller")
+            ax.legend()
+        fig.suptitle("Siffer i antall stemmer ved alle valgkretser i Norge")
         plt.show()
 
+    def show_marginal_seats(self, num_rows = 20):
+        from marginal import marginal_seats
+        print("")
+        print("Mandatene som er nærmest å skifte parti (stemmer utfordreren trenger, eller stemmer som må flyttes fra partiet til utfordreren)")
+        print(marginal_seats(self).head(num_rows).to_string())
+
+    def show_seat_sweep(self, smallest, largest):
+        from sweep import SeatSweep
+        print("")
+        print(f"Mandater per parti med {smallest} til {largest} mandater på Stortinget")
+        print(SeatSweep(self).sweep(np.arange(smallest, largest + 1)).to_string())
+
+    def show_limit_breakpoints(self):
+        from thresholds import limit_seats
+        print("")
+        print("Mandater per parti for alle sperregrenser, med sperregrensen over den første og til og med den andre verdien")
+        print(limit_seats(self).to_string(index = False, float_format = "{:.4f}".format))
+
+    def show_area_sweep(self, lower, upper):
+        from areafactor import area_breakpoints, area_seats
+        changes = area_breakpoints(self, lower, upper)
+        print("")
+        print(f"Arealfaktorene mellom {lower} og {upper} der et valgdistrikt vinner eller taper et mandat")
+        print(changes[["Fra", "Vinner", "Taper"]].iloc[1:].to_string(index = False, float_format = "{:.6f}".format))
+        print("")
+        print(f"Mandater per parti for arealfaktorer mellom {lower} og {upper}")
+        print(area_seats(self, lower, upper).to_string(index = False, float_format = "{:.6f}".format))
+
     def show_individual_districts(self):
         individuals_lowered = [x.lower() for x in self.args.individuals]
 
@@ -583,23 +799,53 @@ class Norway:
         print(f"Grense for utjevningsmandater = {self.args.levelinglimit}%       Første delingstall: {self.args.initialdivisor}")
         print(self.distribution_table)
 
-    def plot_results(self, parliament_rows = 4):
+    @property
+    def _legend_font(self):
+        import matplotlib.font_manager as font_manager
+        return font_manager.FontProperties(family = "Noto Sans", size = 9)
+
+    def _prepare_plots(self):
         if self.args.title == "":
             self.args.title = f"Sperregrense: {self.args.levelinglimit}%     Første delingstall: {self.args.initialdivisor}"
         if not os.path.isdir(self.args.folder):
-            os.makedirs(self.args.folder)
-        save = self.args.saveplot
-        self._legend_font = font_manager.FontProperties(family = "Noto Sans",
-                                                        size = 9)
+            os.makedirs(self.args.folder, exist_ok = True)
+
+    def _save_figure(self, filename):
+        # figures are closed once saved, so drawing many of them doesn't use up the memory
+        import matplotlib.pyplot as plt
+        plt.savefig(os.path.join(self.args.folder, filename))
+        plt.close()
+
+    def plot_figure(self, name, save = True, parliament_rows = 4):
+        # one of the figures in FIGURE_NAMES
+        with tracer.span(name, "plot"):
+            self._plot_figure(name, save = save, parliament_rows = parliament_rows)
+
+    def _plot_figure(self, name, save = True, parliament_rows = 4):
+        if name == "tinget":
+            self.plot_parliament(save = save, num_seats = self._num_seats, num_rows = parliament_rows)
+        elif name == "seter":
+            self.plot_num_seats(save = save)
+        elif name == "kart":
+            self.plot_map(save = save)
+        elif name == "blokker":
+            self.plot_blocks(save = save)
+        else:
+            raise ValueError(f"Unknown figure {name}")
+
+    def plot_results(self, parliament_rows = 4):
+        import matplotlib.pyplot as plt
+        self._prepare_plots()
         self._message_start("Lager figurer")
-        self.plot_parliament(save = save, num_seats = self._num_seats, num_rows = parliament_rows)
-        self.plot_num_seats(save = save)
-        self.plot_map(save = save)
-        self.plot_blocks(save = save)
+        for name in FIGURE_NAMES:
+            self.plot_figure(name, save = self.args.saveplot, parliament_rows = parliament_rows)
         self._message_end()
         if not self.args.saveplot: plt.show()
 
     def plot_parliament(self, save = True, num_seats = 169, num_rows = 4, figsize = None):
+        import matplotlib.patches as patches
+        import matplotlib.pyplot as plt
+        from matplotlib.collections import PolyCollection
         if figsize is None:
             figsize = (15,3)
         fig, ax = plt.subplots(1, 1, figsize = figsize)
@@ -622,12 +868,13 @@ class Norway:
 
         plt.ylim((-1, num_rows))
         plt.xlim((-3, num_columns + 6))
+        edge_colors = {party: self._avg_hex(color, "#000000", weight = 2) for party, color in self.parties_left_to_right.items()}
         i = 0
         while i < num_seats:
             for party, color in self.parties_left_to_right.items():
                 if not party in self.distribution_with_leveling:
                     continue
-                party_circles = []
+                party_seats = []
                 seats = self.distribution_with_leveling[party][0]
                 for seat in range(seats):
                     col = i//num_rows
@@ -643,23 +890,17 @@ class Norway:
                     if col % 2 == 0:
                         row = num_rows - 1 - row
 
-                    if seat == 0:
-                        label = party
-                    else:
-                        label = None
-
-                    hexagon = patches.RegularPolygon((col, row), 6, 0.45,
-                                                     fc = color, ec = self._avg_hex(color, "#000000", weight = 2),
-                                                     label = label, orientation = np.pi/2)
-                    party_circles.append(hexagon)
+                    party_seats.append((col, row))
 
-                for circle in party_circles:
-                    ax.add_patch(circle)
+                if party_seats:
+                    ax.add_collection(PolyCollection(_hexagons(party_seats, 0.45, orientation = np.pi/2),
+                                                     facecolors = color, edgecolors = edge_colors[party], joinstyle = "miter", label = party))
         
         plt.legend(prop = self._legend_font)
-        if save: plt.savefig(os.path.join(self.args.folder, "tinget.png"))
+        if save: self._save_figure("tinget.png")
 
     def plot_num_seats(self, save = True):
+        import matplotlib.pyplot as plt
         plt.figure(figsize = (5, 0.45*max(9, len(self.distribution_with_leveling))))
         plt.title(self.args.title, fontfamily = "Noto Sans")
         plt.axis("off")
@@ -697,102 +938,76 @@ class Norway:
             row += 1
 
         plt.xlim(-0.05, 0.7)
-        if save: plt.savefig(os.path.join(self.args.folder, "seter.png"))
+        if save: self._save_figure("seter.png")
 
     def plot_map(self, save = True):
+        import matplotlib.pyplot as plt
+        from matplotlib.collections import PolyCollection
         fig, ax = plt.subplots(1, 1, figsize = (14,12))
         plt.title(self.args.title, fontfamily = "Noto Sans")
         plt.tight_layout()
 
-        move_right = np.array((np.sqrt(3), 0))
-        move_upleft = np.array((-np.sqrt(3)/2, 3/2))
-        move_left = -move_right
-        move_downleft = np.array((-np.sqrt(3)/2, -3/2))
-        move_downright = -move_upleft
-        move_upright = -move_downleft
-
         hex_radius = 0.14
 
-        parties_in_legend = []
+        edge_colors = {party: self._avg_hex(color, "#000000") for party, color in self.parties_left_to_right.items()}
+        party_seats = {} # party -> (centres, face colours, edge colours), in the order the parties are first drawn
+        legend_colors = {}
+        leveling_seats = []
 
         for district_name, location in self.locations.items():
             leveling_awarded = False
             district_distribution = self.district_distributions[district_name]                
 
-            starting_position = np.array((location[0], location[1]), dtype = np.float)
+            starting_position = np.array((location[0], location[1]), dtype = float)
+            num_seats = sum(district_distribution.values())
+            positions = starting_position + hex_spiral_positions(num_seats)*hex_radius
+            top_y = np.max(positions[:, 1], initial = -np.inf)
 
             seats_plotted = 0
-            position = starting_position.copy()
-            occupied_locations = []
-            move_order = [move_right, move_upright, move_upleft,
-                          move_left, move_downleft, move_downright]
-            current_dir = 2
-            top_y = -np.inf
-
             for party, seats in district_distribution.items():
                 if party in self.parties_left_to_right:
                     color = self.parties_left_to_right[party]
-                    half_color = self._avg_hex(color, "#000000")
+                    half_color = edge_colors[party]
                 for seat in range(seats):
-                    if seats_plotted == 0:
-                        position = starting_position
-                    elif seats_plotted == 1:
-                        position = starting_position + move_right*hex_radius
-                    else:
-                        next_dir = (current_dir + 1)%6
-                        current_move = move_order[current_dir]
-                        next_move = move_order[next_dir]
-
-                        next_pos = position + next_move*hex_radius
-                        is_in = False
-                        for occ in occupied_locations:
-                            occ_x, occ_y = occ
-                            if abs(occ_x - next_pos[0]) < 1e-5 and abs(occ_y - next_pos[1]) < 1e-5:
-                                is_in = True
-                                break
-
-                        if not is_in:
-                            current_move = next_move
-                            current_dir = next_dir
-
-                        position += current_move*hex_radius
-
-                    pos_now = position.copy()
-                    if pos_now[1] > top_y:
-                        top_y = pos_now[1]
-
-                    if party in parties_in_legend:
-                        label = None
+                    pos_now = positions[seats_plotted]
+                    centres, face_colors, half_colors = party_seats.setdefault(party, ([], [], []))
+                    legend_colors.setdefault(party, (color, half_color))
+                    if district_name in self.leveling_awards and self.leveling_awards[district_name] == party and not leveling_awarded:
+                        # the leveling seat is drawn smaller, on top of a gold hexagon
+                        leveling_awarded = True
+                        leveling_seats.append((pos_now, color, half_color))
                     else:
-                        label = self.party_names[party]
-                        parties_in_legend.append(party)
+                        centres.append(pos_now)
+                        face_colors.append(color)
+                        half_colors.append(half_color)
 
-                    leveling_hex = None
-                    if district_name in self.leveling_awards:
-                        if self.leveling_awards[district_name] == party and not leveling_awarded:
-                            leveling_awarded = True
-                            leveling_hex = patches.RegularPolygon(pos_now, 6, hex_radius, color = "gold", ec = "black", zorder = 10)
-
-                    if leveling_hex is None:
-                        hexagon = patches.RegularPolygon(pos_now, 6, hex_radius, color = color, ec = half_color, label = label)
-                    else:
-                        hexagon = patches.RegularPolygon(pos_now, 6, hex_radius*0.7, color = color, ec = half_color, label = label, zorder = 11)
-                        ax.add_patch(leveling_hex)                    
-                    ax.add_patch(hexagon)
-
-                    occupied_locations.append(pos_now)
                     seats_plotted += 1
 
             textlen = len(district_name)*0.05
             plt.text(location[0] - textlen, top_y + hex_radius*1.2, district_name, fontfamily = "Cascadia Code")
 
+        for party, (centres, face_colors, half_colors) in party_seats.items():
+            if not centres:
+                # a party with only a leveling seat still gets its colour in the legend
+                face_colors, half_colors = legend_colors[party]
+            ax.add_collection(PolyCollection(_hexagons(np.reshape(centres, (-1, 2)), hex_radius), facecolors = face_colors,
+                                             edgecolors = half_colors, joinstyle = "miter", label = self.party_names[party]))
+        if leveling_seats:
+            centres, face_colors, half_colors = zip(*leveling_seats)
+            ax.add_collection(PolyCollection(_hexagons(centres, hex_radius), facecolors = "gold",
+                                             edgecolors = "black", joinstyle = "miter", zorder = 10))
+            ax.add_collection(PolyCollection(_hexagons(centres, hex_radius*0.7), facecolors = face_colors,
+                                             edgecolors = half_colors, joinstyle = "miter", zorder = 11))
+
         plt.axis("equal")
         plt.xlim(-6, 7)
         plt.axis("off")
         plt.legend(loc = "upper left", prop = self._legend_font)
-        if save: plt.savefig(os.path.join(self.args.folder, "kart.png"))
+        if save: self._save_figure("kart.png")
 
     def plot_blocks(self, save = True):
+        import matplotlib.colors
+        import matplotlib.pyplot as plt
         plt.figure(figsize = (14,9))
         plt.title(self.args.title, fontfamily = "Noto Sans")
         plt.tight_layout()
@@ -815,47 +1030,68 @@ class Norway:
                   "Sentrum-Sentrum-Høyre": ("H", "SP", "V", "KRF"),
                   "Blåblågrønn": ("H", "SP", "FRP")}
 
+        # one bar per party in every bloc, first the parties in the bloc and then the faded rest
+        colors = {party: matplotlib.colors.to_rgba(color) for party, color in self.parties_left_to_right.items()}
+        faded = {party: (*color[:3], 0.05) for party, color in colors.items()}
+        seated_parties = [party for party in self.parties_left_to_right if party in self.distribution_with_leveling]
+        party_seats = {party: self.distribution_with_leveling[party][0] for party in seated_parties}
         legend_parties = []        
 
         for i, key in enumerate(blocks):
             item = blocks[key]
             plt.text(1, -i + 0.4, key, fontfamily = {"Cascadia Code"})
-            plt.barh(-i, 0.2, 0.8, left = half-0.1, color = "black")
-            plt.barh(-i, seat_sums, 0.6, color = "#bbbbbb", edgecolor = "black")
 
+            # the half-way mark and the background bar come first
+            widths = [0.2, seat_sums]
+            heights = [0.8, 0.6]
+            lefts = [half - 0.1, 0]
+            face_colors = ["black", "#bbbbbb"]
+            edge_colors = ["none", "black"]
+            labels = ["_nolegend_", "_nolegend_"]
+            bloc_parties = [party for party in item if party in party_seats]
+            other_parties = [party for party in seated_parties if party not in item]
             left = 0
-            for party in item:
-                if party not in self.distribution_with_leveling:
-                    continue
-                seats = self.distribution_with_leveling[party][0]
-                if not party in legend_parties:
-                    label = party
-                    legend_parties.append(party)
+            for party in bloc_parties + other_parties:
+                seats = party_seats[party]
+                widths.append(seats)
+                heights.append(0.6)
+                lefts.append(left)
+                if party in item:
+                    face_colors.append(colors[party])
+                    edge_colors.append("black")
+                    if not party in legend_parties:
+                        labels.append(party)
+                        legend_parties.append(party)
+                    else:
+                        labels.append("_nolegend_")
                 else:
-                    label = None
-                plt.barh(-i, seats, 0.6, left = left,
-                         color = self.parties_left_to_right[party],
-                         edgecolor = "black", label = label)
+                    face_colors.append(faded[party])
+                    edge_colors.append((0, 0, 0, 0.05))
+                    labels.append("_nolegend_")
                 left += seats
-
-            for party, color in self.parties_left_to_right.items():
-                if party not in self.distribution_with_leveling:
-                    continue
-                data = self.distribution_with_leveling[party]
-                if party not in item:
-                    seats = data[0]
-                    plt.barh(-i, seats, 0.6, left = left,
-                             color = color,
-                             edgecolor = "black", alpha = 0.05)
-                    left += seats
+            plt.barh(np.full(len(widths), -i), widths, heights, left = lefts,
+                     color = face_colors, edgecolor = edge_colors, label = labels)
         plt.axis("off")
         plt.legend(loc = "upper right", prop = self._legend_font)
-        if save: plt.savefig(os.path.join(self.args.folder, "blokker.png"))
+        if save: self._save_figure("blokker.png")
        
 
+class FigureData(Norway):
+    # The parts of a calculated election the figures are drawn from, small
+    # enough to be sent to another process and drawn there
+    attributes = ("args", "_num_seats", "party_names", "parties_left_to_right", "parties_actual_distri",
+                  "distribution_with_leveling", "distribution_table", "district_distributions",
+                  "leveling_awards", "locations")
+
+    def __init__(self, election):
+        for name in self.attributes:
+            setattr(self, name, getattr(election, name))
+        self.args = copy.copy(election.args)
+
+
 class NewCountiesNorway(Norway):
-    def __init__(self, args, filename = "2021-09-17_partydist.csv", num_leveling_seats = 1):
-        super().__init__(args, filename = filename, num_leveling_seats = num_leveling_seats)
+    def __init__(self, args, filename = NEW_COUNTIES_RESULTS_FILE, num_leveling_seats = 1, cube = None):
+        super().__init__(args, filename = filename, num_leveling_seats = num_leveling_seats, cube = cube)
 
         new_counties = {"Vestland": [12, 14],
                         "Agder": [9, 10],
@@ -882,37 +1118,99 @@ class NewCountiesNorway(Norway):
                      "Troms og Finnmark":    [5, 6.8]}
 
         old_to_new_mapping = {}
-        populations = {}
-        dist_areas = {}
         for county, old_districts in new_counties.items():
-            pops = 0
-            area = 0
             for old_id in old_districts:
-                old_name = self.district_name_by_id[old_id]
-                pops += self.populations[old_name]
-                area += self.dist_areas[old_name]
-                old_to_new_mapping[old_name] = county
+                old_to_new_mapping[self.district_name_by_id[old_id]] = county
 
-            populations[county] = pops
-            dist_areas[county] = area
-            
-        self.populations = populations
-        self.dist_areas = dist_areas
-        self.locations = locations
+        self.merge_districts(old_to_new_mapping, locations = locations)
 
         self._calculate_seat_distribution()
 
-        # change district names to new counties
-        for row in self.results.iterrows():
-            index = row[0]
-            data = row[1]
-            old_fylkenavn = data["Fylkenavn"]
-            new_fylkenavn = old_to_new_mapping[old_fylkenavn]
-            data["Fylkenavn"] = new_fylkenavn
-            self.results.iloc[index] = data
 
+# the six neighbours of a hexagon in axial coordinates (q, r), counter-clockwise from the right
+HEX_DIRECTIONS = np.array([(1, 0), (0, 1), (-1, 1), (-1, 0), (0, -1), (1, -1)])
+_hex_spiral = np.zeros((1, 2), dtype = int)
+
+
+def hex_spiral(num_cells):
+    # Axial coordinates of the first cells of a spiral of hexagons: the
+    # centre, the cell to the right, and then around counter-clockwise,
+    # turning left whenever that cell is free. The spiral is kept for the
+    # largest number of cells asked for, so every district is a table lookup.
+    global _hex_spiral
+    if num_cells > len(_hex_spiral):
+        num_cells_made = max(num_cells, 2*len(_hex_spiral))
+        cells = [(0, 0), (1, 0)]
+        occupied = set(cells)
+        directions = HEX_DIRECTIONS.tolist()
+        direction = 2
+        while len(cells) < num_cells_made:
+            q, r = cells[-1]
+            next_direction = (direction + 1)%6
+            dq, dr = directions[next_direction]
+            if (q + dq, r + dr) not in occupied:
+                direction = next_direction
+            dq, dr = directions[direction]
+            cells.append((q + dq, r + dr))
+            occupied.add(cells[-1])
+        _hex_spiral = np.array(cells, dtype = int)
+    return _hex_spiral[:num_cells]
+
+
+def hex_spiral_positions(num_cells):
+    # centres of the spiral cells for pointy-top hexagons of radius 1
+    axial = hex_spiral(num_cells)
+    return np.stack([np.sqrt(3)*(axial[:, 0] + axial[:, 1]/2), 1.5*axial[:, 1]], axis = 1)
+
+
+def _hexagons(centres, radius, orientation = 0):
+    # corners of hexagons around the centres, like patches.RegularPolygon, for a PolyCollection
+    angles = np.pi/2 + orientation + np.arange(6)*np.pi/3
+    corners = np.stack([np.cos(angles), np.sin(angles)], axis = 1)
+    radius = np.reshape(radius, (-1, 1, 1))
+    return np.asarray(centres, dtype = float)[:, None, :] + radius*corners[None, :, :]
+
+
+@functools.lru_cache(maxsize = None)
+def _read_results(filename):
+    return read_csv_cached(filename)
+
+
+def read_results(filename):
+    # parsed once per process, every caller gets its own copy to modify
+    with tracer.span(f"read_results {filename}", "load"):
+        return _read_results(filename).copy()
+
+
+@functools.lru_cache(maxsize = None)
+def read_adjustments(filename = ADJUSTMENTS_FILE):
+    # (district, party, votes) for every cell of the adjustment sheet
+    adjustments = []
+    for row in read_excel_cached(filename).iterrows():
+        party = row[1]["Partikode"]
+        for name, votes in row[1].items():
+            if name == "Partikode" or name == "Partinavn":
+                continue
+            adjustments.append((name, party, votes))
+    return tuple(adjustments)
+
+
+def load_merge_map(filename):
+    # Columns: Fylkenavn (old district), Valgdistrikt (new district) and
+    # optionally x and y, the position of the new district on the map.
+    merge_map = pd.read_csv(filename, delimiter = ";")
+    mapping = dict(zip(merge_map["Fylkenavn"], merge_map["Valgdistrikt"]))
+
+    locations = {}
+    if "x" in merge_map.columns and "y" in merge_map.columns:
+        placed = merge_map.dropna(subset = ["x", "y"])
+        for new_name, x, y in zip(placed["Valgdistrikt"], placed["x"], placed["y"]):
+            locations[new_name] = [x, y]
 
-def parse_args():
+    return mapping, locations
+
+
+def parse_args(argv = None):
     parser = argparse.ArgumentParser()
     parser.add_argument("-l", "--levelinglimit",
                         help = "The vote share required to be awarded leveling seats",
@@ -935,6 +1233,11 @@ def parse_args():
     parser.add_argument("-n", "--newcounties",
                         help = "Use the modern (new in 2020) counties of Norway to calculate the distribution of seats and results",
                         action = "store_true")
+    parser.add_argument("--mergemap",
+                        help = "Merge electoral districts using a ;-separated file with the columns Fylkenavn (old district) and Valgdistrikt (new district), and optionally x and y for the map position of the new district. The votes in justeringer.ods are added before merging",
+                        default = None,
+                        metavar = "FILE",
+                        type = str)
     parser.add_argument("-s", "--singleseatleveling",
                         help = "Allow parties to compete for leveling seats if they have received direct seats anywhere (or if they reach the limit)",
                         action = "store_true")
@@ -991,12 +1294,82 @@ def parse_args():
                         help = "Folder to save plots in",
                         default = "./figs",
                         type = str)
-    args = parser.parse_args()
+    parser.add_argument("--marginal",
+                        help = "Show the seats that are closest to changing party, and the votes needed to change them",
+                        default = 0,
+                        metavar = "NUMSEATS",
+                        type = int)
+    parser.add_argument("--sweep",
+                        help = "Show the seats per party for every parliament size from MIN to MAX seats",
+                        nargs = 2,
+                        default = None,
+                        metavar = ("MIN", "MAX"),
+                        type = int)
+    parser.add_argument("--areasweep",
+                        help = "Show the area multipliers from MIN to MAX where a district gains or loses a seat, and the seats per party between them",
+                        nargs = 2,
+                        default = None,
+                        metavar = ("MIN", "MAX"),
+                        type = float)
+    parser.add_argument("--limitbreakpoints",
+                        help = "Show the seats per party for every leveling limit, found from the vote shares where the seats can change",
+                        action = "store_true")
+    parser.add_argument("--montecarlo",
+                        help = "Estimate the uncertainty in the seat distribution by recalculating it for this many random variations of the votes",
+                        default = 0,
+                        metavar = "DRAWS",
+                        type = int)
+    parser.add_argument("--noise",
+                        help = "How the votes are varied in the Monte Carlo simulation (default multinomial)",
+                        choices = ["multinomial", "dirichlet"],
+                        default = "multinomial",
+                        type = str)
+    parser.add_argument("--samplesize",
+                        help = "Number of voters per district the vote shares are redrawn from in the Monte Carlo simulation, like the size of a poll (default is the actual number of votes)",
+                        default = None,
+                        type = int)
+    parser.add_argument("--seed",
+                        help = "Seed for the random numbers in the Monte Carlo simulation",
+                        default = None,
+                        type = int)
+    parser.add_argument("--trace",
+                        help = "Write timing spans for every stage, plot and data load, and counters, to FILE",
+                        default = None,
+                        metavar = "FILE",
+                        type = str)
+    parser.add_argument("--traceformat",
+                        help = "Format of the --trace file, json or chrome (for chrome://tracing or Perfetto, default json)",
+                        default = "json",
+                        choices = ["json", "chrome"],
+                        type = str)
+    parser.add_argument("--tracememory",
+                        help = "Also record the peak traced memory of every span in the --trace file (slower)",
+                        action = "store_true")
+    parser.add_argument("--profile",
+                        help = "Run under cProfile and write the statistics to FILE (read with pstats or snakeviz)",
+                        default = None,
+                        metavar = "FILE",
+                        type = str)
+    args = parser.parse_args(argv)
+    if args.mergemap:
+        try:
+            mapping, _ = load_merge_map(args.mergemap)
+        except (OSError, KeyError, ValueError) as error:
+            parser.error(f"--mergemap {args.mergemap} can't be read: {error}")
+        unknown = [str(old_name) for old_name in mapping if old_name not in DISTRICT_POPULATIONS]
+        if unknown:
+            parser.error(f"--mergemap {args.mergemap} has unknown districts: {', '.join(unknown)}")
     return args
 
 
-def main():
-    args = parse_args()
+def make_election(args, filename = None, cube = None):
+    # filename replaces the default results file of the chosen election, or
+    # cube gives the votes directly
+    files = {}
+    if filename is not None:
+        files["filename"] = filename
+    if cube is not None:
+        files["cube"] = cube
 
     if args.noleveling:
         num_leveling_seats = 0
@@ -1004,23 +1377,58 @@ def main():
         num_leveling_seats = 1
 
     if args.onedistrict:
-        norway = Norway(args, num_leveling_seats = 169) # can't disable leveling seats for single district,
-                                                        # since all seats are equivalent to leveling seats
-                                                        # in this case
+        norway = Norway(args, num_leveling_seats = 169, **files) # can't disable leveling seats for single district,
+                                                                 # since all seats are equivalent to leveling seats
+                                                                 # in this case
     elif args.newcounties:
-        norway = NewCountiesNorway(args, num_leveling_seats = num_leveling_seats)
+        norway = NewCountiesNorway(args, num_leveling_seats = num_leveling_seats, **files)
+    elif args.mergemap:
+        norway = Norway(args, num_leveling_seats = num_leveling_seats, **files)
+        # the adjustments are for the old districts, and are merged with them
+        for district, party, votes in read_adjustments():
+            norway.add_votes(district, party, votes)
+        mapping, locations = load_merge_map(args.mergemap)
+        try:
+            norway.merge_districts(mapping, locations = locations)
+        except ValueError as error:
+            raise ValueError(f"{args.mergemap}: {error}") from None
     else:
-        norway = Norway(args, num_leveling_seats = num_leveling_seats)
-        adjustments = pd.read_excel("justeringer.ods")
-        for row in adjustments.iterrows():
-            party = row[1]["Partikode"]
-            for district in row[1].iteritems():
-                name = district[0]
-                votes = district[1]
-                if name == "Partikode" or name == "Partinavn":
-                    continue
-                norway.add_votes(name, party, votes)
-
+        norway = Norway(args, num_leveling_seats = num_leveling_seats, **files)
+        for district, party, votes in read_adjustments():
+            norway.add_votes(district, party, votes)
+
+    return norway
+
+
+def input_files(args, filename = None):
+    # the data files make_election reads for these arguments
+    if args.newcounties and not args.onedistrict:
+        return [filename or NEW_COUNTIES_RESULTS_FILE]
+    files = [filename or RESULTS_FILE]
+    if args.mergemap and not args.onedistrict:
+        files.append(args.mergemap)
+    elif not args.onedistrict:
+        files.append(ADJUSTMENTS_FILE)
+    return files
+
+
+def run(args):
+    if args.trace or args.profile:
+        tracer.enable(memory = args.tracememory, profile = bool(args.profile))
+    try:
+        return _run(args)
+    finally:
+        if tracer.enabled:
+            tracer.disable()
+            if args.trace:
+                tracer.save(args.trace, trace_format = args.traceformat)
+            if args.profile:
+                tracer.save_profile(args.profile)
+
+
+def _run(args):
+    with tracer.span("make_election", "load"):
+        norway = make_election(args)
     norway.calculate(dist_method = args.method, num_seats = 169)
 
     if args.results:
@@ -1030,11 +1438,42 @@ def main():
         norway.show_individual_districts()
 
     if args.runanalyze:
-        norway.analyze()
+        with tracer.span("analyze", "report"):
+            norway.analyze()
+
+    if args.marginal:
+        with tracer.span("marginal", "report"):
+            norway.show_marginal_seats(num_rows = args.marginal)
+
+    if args.sweep:
+        with tracer.span("sweep", "report"):
+            norway.show_seat_sweep(*args.sweep)
+
+    if args.areasweep:
+        with tracer.span("areasweep", "report"):
+            norway.show_area_sweep(*args.areasweep)
+
+    if args.limitbreakpoints:
+        with tracer.span("limitbreakpoints", "report"):
+            norway.show_limit_breakpoints()
+
+    if args.montecarlo:
+        from montecarlo import SeatSimulation
+        with tracer.span("montecarlo", "report"):
+            simulation = SeatSimulation(norway).simulate(args.montecarlo, noise = args.noise,
+                                                         sample_size = args.samplesize, seed = args.seed)
+            simulation.show()
 
     if args.plot:
         norway.plot_results(parliament_rows = 4)
 
+    return norway
+
+
+def main():
+    args = parse_args()
+    run(args)
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,158 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+# expected share of each digit (0-9) in every position
+DIGIT_PROBABILITIES = {
+    "first": np.concatenate([[0], np.log10(1 + 1/np.arange(1, 10))]),
+    "second": np.array([np.sum(np.log10(1 + 1/(10*np.arange(1, 10) + digit))) for digit in range(10)]),
+    "last": np.full(10, 0.1),
+}
+MAD_LIMITS = { # Nigrini's limits for close, acceptable and marginal conformity
+    "first": (0.006, 0.012, 0.015),
+    "second": (0.008, 0.010, 0.012),
+}
+CONFORMITY = ["God", "Akseptabel", "Marginal", "Avvikende"]
+POSITION_NAMES = {"first": "Første siffer", "second": "Andre siffer", "last": "Siste siffer"}
+POWERS = 10**np.arange(19, dtype = np.int64)
+
+
+def num_digits(values):
+    # number of digits in positive integers, from log10 and corrected where
+    # the float rounds the wrong way near the powers of ten
+    values = np.asarray(values, dtype = np.int64)
+    exponents = np.log10(np.maximum(values, 1)).astype(np.int64)
+    exponents -= values < POWERS[exponents]
+    exponents += (exponents < 18) & (values >= POWERS[np.minimum(exponents + 1, 18)])
+    return exponents + 1
+
+
+def digit_table(values, groups = None, num_groups = None):
+    # Counts of every value by its two leading digits (the value itself below
+    # 10) and its last digit, as groups x 100 x 10. Every digit test can be
+    # read off this table, so the values are only split into digits once.
+    values = np.asarray(values, dtype = np.int64)
+    leading = values // POWERS[np.maximum(num_digits(values) - 2, 0)]
+    codes = leading*10 + values % 10
+    if groups is None:
+        return np.bincount(codes, minlength = 1000).reshape(1, 100, 10)
+    groups = np.asarray(groups, dtype = np.int64)
+    if num_groups is None:
+        num_groups = int(np.max(groups, initial = -1)) + 1
+    return np.bincount(groups*1000 + codes, minlength = num_groups*1000).reshape(num_groups, 100, 10)
+
+
+def position_counts(table, position = "first"):
+    # counts of every digit (0-9) in the given position for every group of a digit table,
+    # values too small to have the digit are left out
+    leading = np.sum(table, axis = 2) # groups x two leading digits
+    if position == "first":
+        counts = np.zeros((len(table), 10), dtype = np.int64)
+        counts[:, 1:] = leading[:, 1:10] + leading[:, 10:].reshape(-1, 9, 10).sum(axis = 2)
+        return counts
+    if position == "second":
+        return leading[:, 10:].reshape(-1, 9, 10).sum(axis = 1)
+    return np.sum(table[:, 10:], axis = 1)
+
+
+def digit_counts(values, position = "first", groups = None, num_groups = None):
+    # counts of every digit (0-9), as one row per group when group codes are given
+    counts = position_counts(digit_table(values, groups, num_groups), position)
+    return counts[0] if groups is None else counts
+
+
+def digit_statistics(counts, position = "first"):
+    # chi-square and mean absolute deviation from the expected digit shares
+    # for every row of counts, with the degrees of freedom of the test
+    counts = np.atleast_2d(counts).astype(float)
+    expected_shares = DIGIT_PROBABILITIES[position]
+    tested = expected_shares > 0
+    totals = np.sum(counts, axis = 1)
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+        shares = counts/totals[:, None]
+        expected = totals[:, None]*expected_shares
+        chi_square = np.sum(((counts - expected)**2/expected)[:, tested], axis = 1)
+    mad = np.mean(np.abs(shares - expected_shares)[:, tested], axis = 1)
+    return totals.astype(int), chi_square, mad, int(np.sum(tested)) - 1
+
+
+def conformity(mad, position):
+    if position not in MAD_LIMITS:
+        return np.full(np.shape(mad), "", dtype = object)
+    labels = np.array(CONFORMITY, dtype = object)[np.searchsorted(MAD_LIMITS[position], mad)]
+    return np.where(np.isnan(mad), "", labels)
+
+
+def digit_tests(results, by = None, positions = ("first", "second", "last"),
+                value_column = "Antall stemmer totalt", min_count = 1):
+    # Digit tests of the vote counts in results (one row per party and polling
+    # station), for all rows or per value of the by column. Returns a table
+    # with the number of values, chi-square, MAD and conformity per position.
+    values = results[value_column].to_numpy(dtype = np.int64)
+    if by is None:
+        groups = np.zeros(len(values), dtype = np.int64)
+        names = pd.Index(["Alle"])
+    else:
+        groups, names = pd.factorize(results[by], sort = True)
+        # rows without a value in the by column belong to no group
+        values = values[groups >= 0]
+        groups = groups[groups >= 0]
+
+    table = digit_table(values, groups, num_groups = len(names))
+    columns = {}
+    for position in positions:
+        counts = position_counts(table, position)
+        totals, chi_square, mad, _ = digit_statistics(counts, position)
+        name = POSITION_NAMES[position]
+        columns[(name, "N")] = totals
+        columns[(name, "Kjikvadrat")] = chi_square
+        columns[(name, "MAD")] = mad
+        if position in MAD_LIMITS:
+            columns[(name, "Samsvar")] = conformity(mad, position)
+
+    table = pd.DataFrame(columns, index = names)
+    table.index.name = by
+    first = POSITION_NAMES[positions[0]]
+    table = table[table[(first, "N")] >= min_count]
+    return table.sort_values((first, "MAD"), ascending = False)
+
+
+def main():
+    from election import read_results
+
+    parser = argparse.ArgumentParser(description = "Benford tests of the vote counts at every polling station")
+    parser.add_argument("resultfiles",
+                        help = "Results files per polling station (default 2021-09-15_partydist_smalldistricts.csv)",
+                        nargs = "*",
+                        default = ["2021-09-15_partydist_smalldistricts.csv"])
+    parser.add_argument("-n", "--numrows",
+                        help = "Number of municipalities and parties to show (default 20)",
+                        default = 20,
+                        type = int)
+    parser.add_argument("-m", "--mincount",
+                        help = "Smallest number of vote counts for a municipality or party to be tested (default 50)",
+                        default = 50,
+                        type = int)
+    args = parser.parse_args()
+
+    results = pd.concat([read_results(filename) for filename in args.resultfiles], ignore_index = True)
+    start_time = time.perf_counter()
+    total = digit_tests(results)
+    municipalities = digit_tests(results, by = "Kommunenavn", min_count = args.mincount)
+    parties = digit_tests(results, by = "Partinavn", min_count = args.mincount)
+    duration = time.perf_counter() - start_time
+
+    print(f"Siffertester av {len(results)} rader ({duration:.3f}s)")
+    print(total.to_string())
+    print("")
+    print("Kommunene med størst avvik i første siffer")
+    print(municipalities.head(args.numrows).to_string())
+    print("")
+    print("Partiene med størst avvik i første siffer")
+    print(parties.head(args.numrows).to_string())
+
+
+if __name__ == "__main__":
+    main()
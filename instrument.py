@@ -0,0 +1,119 @@
+import contextlib
+import json
+import os
+import time
+
+
+class Tracer:
+    # Nested timing spans and counters for one run. Everything is a no-op
+    # until enable() is called, so the instrumented code pays one attribute
+    # check per span when tracing is off.
+    def __init__(self):
+        self.enabled = False
+        self.memory = False
+        self.spans = [] # name, category, start, duration, depth and peak traced memory of every finished span
+        self.counters = {}
+        self._stack = []
+        self._start_time = time.perf_counter()
+        self._profiler = None
+
+    def enable(self, memory = False, profile = False):
+        self.enabled = True
+        self.spans = []
+        self.counters = {}
+        self._stack = []
+        self._start_time = time.perf_counter()
+        self.memory = memory
+        if memory:
+            import tracemalloc
+            tracemalloc.start()
+        if profile:
+            import cProfile
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+
+    def disable(self):
+        while self._stack:
+            self.end()
+        if self.memory:
+            import tracemalloc
+            tracemalloc.stop()
+        if self._profiler is not None:
+            self._profiler.disable()
+        self.enabled = False
+
+    def begin(self, name, category = "stage"):
+        if not self.enabled:
+            return
+        peak = None
+        if self.memory:
+            import tracemalloc
+            # the peak so far belongs to the enclosing span, the new span measures its own from here
+            if self._stack:
+                self._stack[-1]["peak"] = max(self._stack[-1]["peak"], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+            peak = 0
+        self._stack.append({"name": name, "category": category, "start": time.perf_counter(), "peak": peak})
+
+    def end(self):
+        if not self.enabled or not self._stack:
+            return
+        span = self._stack.pop()
+        end_time = time.perf_counter()
+        if self.memory:
+            import tracemalloc
+            span["peak"] = max(span["peak"], tracemalloc.get_traced_memory()[1])
+            if self._stack:
+                self._stack[-1]["peak"] = max(self._stack[-1]["peak"], span["peak"])
+        self.spans.append({"name": span["name"],
+                           "category": span["category"],
+                           "start": span["start"] - self._start_time,
+                           "duration": end_time - span["start"],
+                           "depth": len(self._stack),
+                           "peak_memory": span["peak"]})
+
+    @contextlib.contextmanager
+    def span(self, name, category = "stage"):
+        if not self.enabled:
+            yield
+            return
+        self.begin(name, category)
+        try:
+            yield
+        finally:
+            self.end()
+
+    def count(self, name, amount = 1):
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def to_json(self):
+        return {"spans": sorted(self.spans, key = lambda span: span["start"]),
+                "counters": dict(self.counters)}
+
+    def to_chrome_trace(self):
+        # the Trace Event Format read by chrome://tracing and Perfetto, times in microseconds
+        pid = os.getpid()
+        events = []
+        for span in sorted(self.spans, key = lambda span: span["start"]):
+            event = {"name": span["name"], "cat": span["category"], "ph": "X", "pid": pid, "tid": 0,
+                     "ts": span["start"]*1e6, "dur": span["duration"]*1e6}
+            if span["peak_memory"] is not None:
+                event["args"] = {"peak_memory": span["peak_memory"]}
+            events.append(event)
+        end = max([(span["start"] + span["duration"])*1e6 for span in self.spans], default = 0)
+        for name, value in self.counters.items():
+            events.append({"name": name, "ph": "C", "pid": pid, "tid": 0, "ts": end, "args": {name: value}})
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def save(self, filename, trace_format = "json"):
+        trace = self.to_chrome_trace() if trace_format == "chrome" else self.to_json()
+        with open(filename, "w", encoding = "utf-8") as outfile:
+            json.dump(trace, outfile, indent = 1)
+
+    def save_profile(self, filename):
+        if self._profiler is not None:
+            self._profiler.dump_stats(filename)
+
+
+tracer = Tracer()
@@ -0,0 +1,132 @@
+import numpy as np
+
+from district import apportion, priority_sequence
+from instrument import tracer
+
+
+def assign_leveling_seats(rest_quotients, seats_to_award):
+    # Hand out leveling seats by descending rest quotient (districts x parties).
+    # Every district gets at most one leveling seat, and every party at most
+    # its number of seats to award. Returns (district, party) index pairs in
+    # the order the seats were awarded.
+    rest_quotients = np.asarray(rest_quotients, dtype = float)
+    seats_left = np.array(seats_to_award, dtype = int)
+    num_districts, num_parties = rest_quotients.shape
+    if num_parties == 0:
+        return []
+
+    order = np.argsort(-rest_quotients, axis = None, kind = "stable")
+    districts, parties = np.divmod(order, num_parties)
+    district_free = np.ones(num_districts, dtype = bool)
+    seats_left_total = np.sum(np.maximum(seats_left, 0))
+
+    awards = []
+    for district, party in zip(districts.tolist(), parties.tolist()):
+        if len(awards) == num_districts or seats_left_total == 0:
+            break
+        if not district_free[district] or seats_left[party] <= 0:
+            continue
+        awards.append((district, party))
+        district_free[district] = False
+        seats_left[party] -= 1
+        seats_left_total -= 1
+
+    return awards
+
+
+def assign_leveling_seats_batch(rest_quotients, seats_to_award):
+    # assign_leveling_seats for a batch of elections at once, rest_quotients is
+    # elections x districts x parties and seats_to_award elections x parties.
+    # Returns the party awarded the leveling seat in each district, or -1.
+    rest_quotients = np.asarray(rest_quotients, dtype = float)
+    num_elections, num_districts, num_parties = rest_quotients.shape
+    seats_left = np.array(seats_to_award, dtype = int)
+    awards = np.full((num_elections, num_districts), -1)
+    if num_parties == 0:
+        return awards
+
+    order = np.argsort(-rest_quotients.reshape(num_elections, -1), axis = -1, kind = "stable")
+    districts, parties = np.divmod(order, num_parties)
+    elections = np.arange(num_elections)
+    open_elections = np.sum(np.maximum(seats_left, 0), axis = -1) > 0
+
+    for rank in range(num_districts*num_parties):
+        if not np.any(open_elections):
+            break
+        district = districts[:, rank]
+        party = parties[:, rank]
+        award = open_elections & (awards[elections, district] < 0) & (seats_left[elections, party] > 0)
+        awards[elections[award], district[award]] = party[award]
+        seats_left[elections[award], party[award]] -= 1
+        open_elections &= np.any(awards < 0, axis = -1) & (np.sum(np.maximum(seats_left, 0), axis = -1) > 0)
+
+    return awards
+
+
+def leveling_distribution(party_votes, district_seats, competing, leveling_seats,
+                          method = "stlague", initial_divisor = 1.4):
+    # National leveling stage for a batch of elections (parties along the last
+    # axis). The competing parties share leveling_seats by votes. Parties that
+    # already hold at least as many district seats as they would get there keep
+    # their district seats and drop out, and the rest is recalculated until no
+    # party is overrepresented. Returns the total seats per party and the mask
+    # of parties that ended up with leveling seats.
+    party_votes = np.asarray(party_votes, dtype = float)
+    district_seats = np.asarray(district_seats, dtype = int)
+    leveling = np.array(np.broadcast_to(competing, party_votes.shape), dtype = bool)
+    seats_left = np.array(np.broadcast_to(leveling_seats, party_votes.shape[:-1]), dtype = int)
+
+    seats = apportion(party_votes, seats_left, method = method,
+                      initial_divisor = initial_divisor, present = leveling)
+    over = leveling & (district_seats >= seats)
+    while np.any(over):
+        changed = np.any(over, axis = -1)
+        leveling &= ~over
+        seats_left = seats_left - np.sum(district_seats*over, axis = -1)
+        seats[changed] = apportion(party_votes[changed], seats_left[changed], method = method,
+                                   initial_divisor = initial_divisor, present = leveling[changed])
+        over = leveling & (district_seats >= seats)
+
+    return np.where(leveling, seats, district_seats), leveling
+
+
+def solve_leveling(party_votes, district_seats, leveling_seats, method = "stlague", initial_divisor = 1.4,
+                   order = None):
+    # National leveling stage for one election, with the same result as
+    # recalculating a District until no party is overrepresented. The order
+    # the seats are won in is worked out once, and every pass only counts the
+    # first seats of it that belong to the parties still leveling. The seats
+    # left after a pass are never more than the remaining parties already
+    # held, so the first leveling_seats entries of the order are all any pass
+    # can reach. The order can be passed in, from priority_sequence for these
+    # parties and at least leveling_seats seats, to reuse it between calls.
+    # Returns the seats of every party and the mask of parties that keep
+    # leveling seats.
+    party_votes = np.asarray(party_votes, dtype = float)
+    district_seats = np.asarray(district_seats, dtype = int)
+    num_parties = len(party_votes)
+    if order is None:
+        order, _ = priority_sequence(party_votes, leveling_seats, method = method, initial_divisor = initial_divisor)
+    leveling = np.ones(num_parties, dtype = bool)
+    seats_left = leveling_seats
+
+    while True:
+        tracer.count("leveling iterations")
+        won = order[leveling[order]][:max(seats_left, 0)]
+        seats = np.bincount(won, minlength = num_parties)
+        over = leveling & (district_seats >= seats)
+        if not np.any(over):
+            return seats, leveling
+        leveling &= ~over
+        seats_left -= int(np.sum(district_seats[over]))
+
+
+def level_parties(competing_votes, distribution, leveling_seats, method = "stlague", initial_divisor = 1.4):
+    # solve_leveling for the parties (or candidates) in competing_votes, given
+    # the seats they won in the districts. Returns the leveling distribution of
+    # the parties that keep leveling seats, in the order of competing_votes.
+    names = list(competing_votes)
+    seats, leveling = solve_leveling([competing_votes[name] for name in names],
+                                     [distribution.get(name, 0) for name in names],
+                                     leveling_seats, method = method, initial_divisor = initial_divisor)
+    return {name: int(seats[idx]) for idx, name in enumerate(names) if leveling[idx]}
@@ -0,0 +1,214 @@
+import numpy as np
+import pandas as pd
+
+from district import apportion, seat_divisors
+from leveling import assign_leveling_seats
+
+
+def _votes_needed(gap, wins_ties):
+    # smallest whole number of votes that closes the gap, ties go to the party
+    # listed first like in apportion
+    return np.where(wins_ties, np.maximum(np.ceil(gap), 1), np.floor(gap) + 1)
+
+
+def _settle(votes_moved, changes, max_steps = 10):
+    # The quotient gaps give the answer up to rounding of exact ties, so step
+    # to the smallest number of votes that actually changes the seat. Votes
+    # that also move the Huntington-Hill threshold can be further off, then
+    # the estimate is kept.
+    estimate = votes_moved
+    steps = 0
+    while not changes(votes_moved):
+        votes_moved += 1
+        steps += 1
+        if steps > max_steps:
+            return estimate
+    while votes_moved > 1 and changes(votes_moved - 1) and steps < 2*max_steps:
+        votes_moved -= 1
+        steps += 1
+    return votes_moved
+
+
+def direct_seat_margins(votes, seats, present, method = "stlague", initial_divisor = 1.4,
+                        initial_seats = 1, hh_threshold = 4):
+    # For every seat won in one district (votes, seats and present per party),
+    # find the party that needs the fewest extra votes to take it. A party
+    # taking seat number k of another party must first take every other seat
+    # with a lower quotient, so it has to beat that quotient with the divisor
+    # for the number of seats it would then hold. Returns a list of
+    # (holder, seat number, challenger, extra votes, transferred votes), where
+    # the transfer (votes moved from the holder to the challenger) is only
+    # given for the last seat of each party.
+    votes = np.asarray(votes, dtype = float)
+    seats = np.asarray(seats, dtype = int)
+    present = np.asarray(present, dtype = bool)
+    method = method.lower()
+    num_parties = len(votes)
+    total_seats = int(np.sum(seats))
+    party_ids = np.arange(num_parties)
+    first_seat = np.zeros(num_parties, dtype = int)
+    if method in ("hunthill", "hh"):
+        # parties below the threshold can't win seats, and the initial seats are not won by quotient
+        present = present & (votes/np.sum(votes*present)*100 >= hh_threshold)
+        first_seat = np.where(present, initial_seats, 0)
+
+    holders = np.repeat(party_ids, np.maximum(seats - first_seat, 0))
+    if len(holders) == 0:
+        return []
+    seat_numbers = np.concatenate([np.arange(first_seat[party], seats[party]) for party in party_ids]).astype(int)
+    quotients = votes[holders]/seat_divisors(seat_numbers, method = method, initial_divisor = initial_divisor)
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+        next_quotients = np.where(present, votes/seat_divisors(seats, method = method, initial_divisor = initial_divisor), -np.inf)
+
+    # seats a challenger would have to take before (and including) each seat
+    below = quotients[None, :] <= quotients[:, None] # seats x seats
+    others = holders[None, :] != party_ids[:, None] # parties x seats
+    to_take = others.astype(int) @ below.T.astype(int) # parties x seats
+
+    divisors = seat_divisors(seats[:, None] + to_take - 1, method = method, initial_divisor = initial_divisor)
+    wins_ties = party_ids[:, None] < holders[None, :]
+    extra = _votes_needed(quotients[None, :]*divisors - votes[:, None], wins_ties)
+    extra[~others | ~present[:, None]] = np.inf
+    challengers = np.argmin(extra, axis = 0)
+
+    def seats_after(challenger, added, holder = None, removed = 0):
+        changed = votes.copy()
+        changed[challenger] += added
+        if holder is not None:
+            changed[holder] -= removed
+        return apportion(changed, total_seats, method = method, initial_divisor = initial_divisor,
+                         initial_seats = initial_seats, hh_threshold = hh_threshold, present = present)
+
+    margins = []
+    for i, (holder, seat_number, challenger) in enumerate(zip(holders, seat_numbers, challengers)):
+        if not np.isfinite(extra[challenger, i]):
+            continue
+        needed = _settle(extra[challenger, i],
+                         lambda added: seats_after(challenger, added)[holder] <= seat_number)
+
+        transfer = np.nan
+        if seat_number == seats[holder] - 1:
+            # the challenger's next quotient has to pass the holder's last one,
+            # the holder has to drop below every seat won by the remaining
+            # parties, and the challenger has to stay ahead of their best
+            # losing quotient so the seat goes to the challenger
+            challenger_divisor = seat_divisors(seats[challenger], method = method, initial_divisor = initial_divisor)
+            holder_divisor = seat_divisors(seat_number, method = method, initial_divisor = initial_divisor)
+            rest = (holders != holder) & (holders != challenger)
+            rest_parties = (party_ids != holder) & (party_ids != challenger)
+            gap = max((votes[holder]*challenger_divisor - votes[challenger]*holder_divisor)/(challenger_divisor + holder_divisor),
+                      votes[holder] - np.min(quotients[rest], initial = np.inf)*holder_divisor,
+                      np.max(next_quotients[rest_parties], initial = 0)*challenger_divisor - votes[challenger])
+            if gap < votes[holder]:
+                def takes_seat(moved):
+                    moved_seats = seats_after(challenger, moved, holder, moved)
+                    return moved_seats[holder] <= seat_number and moved_seats[challenger] > seats[challenger]
+                transfer = _settle(_votes_needed(gap, challenger < holder), takes_seat)
+        margins.append((holder, seat_number + 1, challenger, needed, transfer))
+    return margins
+
+
+def _first_flip(flips, upper = np.inf):
+    # smallest whole number of votes from 1 to upper where flips is true (or
+    # nan), found by doubling and then halving the step
+    low, high = 0, 1
+    while not flips(high):
+        if high >= upper:
+            return np.nan
+        low, high = high, min(2*high, upper)
+    while high - low > 1:
+        middle = (low + high)//2
+        if flips(middle):
+            high = middle
+        else:
+            low = middle
+    return high
+
+
+def leveling_seat_margins(votes, divisors, district_votes, district_seats, awards, seats_to_award, max_votes):
+    # votes and divisors are the rest quotient tables (districts x leveling
+    # parties) without the district divisor district_votes/district_seats.
+    # awards is the party given the leveling seat in each district (or -1).
+    # The seats are handed out greedily over all districts, so a challenger
+    # that passes the holder in one district can still lose the seat to an
+    # award elsewhere, and every candidate is settled by handing out the
+    # leveling seats again with its votes changed. The direct seats and the
+    # leveling seats per party are kept as they are, and a challenger that
+    # can't take the seat with max_votes more votes (the national total) is
+    # left out. Returns (district, holder, challenger, extra votes,
+    # transferred votes) for every leveling seat.
+    votes = np.asarray(votes, dtype = float)
+    divisors = np.asarray(divisors, dtype = float)
+    district_votes = np.asarray(district_votes, dtype = float)
+    district_seats = np.asarray(district_seats, dtype = float)
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+        rest_quotients = votes/divisors/(district_votes/district_seats)[:, None]
+    can_take = np.asarray(seats_to_award) > 0
+
+    def award_after(district, challenger, added, holder = None, removed = 0):
+        changed = votes[district].copy()
+        changed[challenger] += added
+        if holder is not None:
+            changed[holder] -= removed
+        quotients = rest_quotients.copy()
+        with np.errstate(divide = "ignore", invalid = "ignore"):
+            quotients[district] = changed/divisors[district]/((district_votes[district] + added - removed)/district_seats[district])
+        for dis_idx, party_idx in assign_leveling_seats(quotients, seats_to_award):
+            if dis_idx == district:
+                return party_idx
+        return -1
+
+    margins = []
+    for district in np.flatnonzero(np.asarray(awards) >= 0):
+        holder = awards[district]
+        best = None
+        for challenger in np.flatnonzero(can_take):
+            if challenger == holder:
+                continue
+            extra = _first_flip(lambda added: award_after(district, challenger, added) == challenger,
+                                upper = int(max_votes))
+            if np.isnan(extra):
+                continue
+            if best is None or extra < best[1]:
+                best = (challenger, extra)
+        if best is None:
+            continue
+        challenger, extra = best
+        holder_votes = int(votes[district, holder])
+        transfer = _first_flip(lambda moved: award_after(district, challenger, moved, holder, moved) == challenger,
+                               upper = holder_votes) if holder_votes > 0 else np.nan
+        margins.append((district, holder, challenger, extra, transfer))
+    return margins
+
+
+def marginal_seats(norway):
+    # All district seats of a calculated election, ranked by the number of
+    # extra votes the closest challenger in the district needs to take them
+    rows = []
+    for dis_idx, district_name in enumerate(norway.electoral_districts):
+        margins = direct_seat_margins(norway.direct_votes[dis_idx],
+                                      norway.direct_seats[dis_idx],
+                                      norway.direct_competing[dis_idx],
+                                      method = norway.dist_method,
+                                      initial_divisor = norway.args.initialdivisor)
+        for holder, seat_number, challenger, extra, transfer in margins:
+            rows.append([district_name, "Direkte", norway.direct_parties[holder], seat_number,
+                         norway.direct_parties[challenger], extra, transfer])
+
+    awards = np.full(len(norway.electoral_districts), -1)
+    for district_name, party in norway.leveling_awards.items():
+        awards[norway.electoral_districts.index(district_name)] = norway.leveling_parties.index(party)
+    for dis_idx, holder, challenger, extra, transfer in leveling_seat_margins(norway.leveling_votes,
+                                                                              norway.leveling_divisors,
+                                                                              norway.leveling_district_votes,
+                                                                              norway.leveling_district_seats,
+                                                                              awards, norway.leveling_seats_to_award,
+                                                                              norway.total_minus_blanks):
+        rows.append([norway.electoral_districts[dis_idx], "Utjevning", norway.leveling_parties[holder], np.nan,
+                     norway.leveling_parties[challenger], extra, transfer])
+
+    table = pd.DataFrame(rows, columns = ["Valgdistrikt", "Mandat", "Parti", "Mandat nr.",
+                                          "Utfordrer", "Stemmer", "Overførte stemmer"])
+    table = table.sort_values(["Stemmer", "Valgdistrikt"], kind = "stable").reset_index(drop = True)
+    table.index += 1
+    return table
@@ -0,0 +1,175 @@
+import numpy as np
+import pandas as pd
+
+from district import apportion
+from leveling import assign_leveling_seats_batch, leveling_distribution
+
+
+def perturb_votes(votes, draws, noise = "multinomial", sample_size = None, rng = None):
+    # Random variations of a districts x parties vote matrix, shaped draws x
+    # districts x parties. The vote shares in each district are redrawn, either
+    # as multinomial counts from sample_size voters or from a Dirichlet with
+    # concentration sample_size, and scaled back up to the votes in the district.
+    # Without a sample size, the number of votes in the district is used.
+    rng = np.random.default_rng(rng)
+    votes = np.asarray(votes, dtype = float)
+    totals = np.sum(votes, axis = -1)
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+        shares = np.nan_to_num(votes/totals[:, None])
+    if sample_size is None:
+        sizes = np.rint(totals).astype(np.int64)
+    else:
+        sizes = np.full(len(votes), sample_size, dtype = np.int64)
+
+    if noise == "multinomial":
+        sampled = rng.multinomial(sizes, shares, size = (draws, len(votes)))
+    elif noise == "dirichlet":
+        sampled = rng.standard_gamma(shares*sizes[:, None], size = (draws,) + votes.shape)
+        sizes = np.sum(sampled, axis = -1, keepdims = True)
+        with np.errstate(divide = "ignore", invalid = "ignore"):
+            return np.nan_to_num(sampled/sizes)*totals[:, None]
+    else:
+        raise ValueError(f"Unknown noise model {noise}")
+
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+        return sampled*np.nan_to_num(totals/sizes)[:, None]
+
+
+class SeatSimulation:
+    # Evaluates the whole seat calculation of a calculated Norway model for
+    # many variations of the district votes at once. Every stage works on
+    # arrays with the draws along the first axis.
+    def __init__(self, norway):
+        args = norway.args
+        self.norway = norway
+        self.parties = list(norway.direct_parties)
+        self.districts = list(norway.electoral_districts)
+        self.votes = norway.direct_votes
+        self.running = norway.direct_running
+        self.method = args.method
+        self.initial_divisor = args.initialdivisor
+        self.leveling_limit = args.levelinglimit
+        self.hardlimit = args.hardlimit
+        self.singleseatleveling = args.singleseatleveling
+        self.num_seats = norway._num_seats
+        self.seats_without_leveling = np.array([norway.seats_without_leveling[name] for name in self.districts])
+        if args.method == "dhondt":
+            self.leveling_method = "dhondt"
+        else:
+            self.leveling_method = "stlague"
+
+        # votes that count towards the national total without being in the
+        # votes matrix (blank votes when couchvoters are included, for instance)
+        self.other_votes = norway.total_minus_blanks - np.sum(self.votes)
+        # couchvoters get no rest quotients, and the district totals used for
+        # the rest quotients leave out blank votes and couchvoters
+        self.quotient_parties = np.array([party != "HJEM" for party in self.parties])
+        self.total_parties = np.array([party not in ("BLANKE", "HJEM") for party in self.parties])
+
+    def evaluate(self, votes):
+        # votes is draws x districts x parties, returns the seats per party
+        # (draws x parties) and per district (draws x districts x parties)
+        votes = np.asarray(votes, dtype = float)
+        party_votes = np.sum(votes, axis = 1)
+        party_shares = 100*party_votes/(np.sum(party_votes, axis = -1, keepdims = True) + self.other_votes)
+
+        competing = np.broadcast_to(self.running, votes.shape)
+        if self.hardlimit:
+            competing = competing & (party_shares >= self.leveling_limit)[:, None, :]
+        district_seats = apportion(votes, self.seats_without_leveling, method = self.method,
+                                   initial_divisor = self.initial_divisor, present = competing)
+        direct_party_seats = np.sum(district_seats, axis = 1)
+
+        leveling_parties = party_shares >= self.leveling_limit
+        if self.singleseatleveling:
+            leveling_parties |= direct_party_seats >= 1
+        leveling_seats = self.num_seats - np.sum(direct_party_seats*~leveling_parties, axis = -1)
+        party_seats, leveling_parties = leveling_distribution(party_votes, direct_party_seats, leveling_parties,
+                                                              leveling_seats, method = self.leveling_method)
+
+        # district leveling seats by rest quotient
+        if self.method == "dhondt":
+            divisors = district_seats + 1
+        else:
+            divisors = district_seats*2 + 1
+        district_totals = np.sum(votes[..., self.total_parties], axis = -1)
+        with np.errstate(divide = "ignore", invalid = "ignore"):
+            district_divisors = district_totals/self.seats_without_leveling
+            rest_quotients = (votes*self.quotient_parties/divisors)/district_divisors[..., None]
+        rest_quotients[~np.broadcast_to(leveling_parties[:, None, :], rest_quotients.shape)] = -np.inf
+        awards = assign_leveling_seats_batch(rest_quotients, party_seats - direct_party_seats)
+
+        awarded = awards >= 0
+        draw_ids, district_ids = np.nonzero(awarded)
+        district_seats[draw_ids, district_ids, awards[awarded]] += 1
+
+        return party_seats, district_seats
+
+    def simulate(self, draws, noise = "multinomial", sample_size = None, batch_size = 1000, seed = None):
+        rng = np.random.default_rng(seed)
+        max_district_seats = max(int(np.max(self.seats_without_leveling)), 0) + 1
+        party_counts = np.zeros((len(self.parties), self.num_seats + 1), dtype = np.int64)
+        district_counts = np.zeros((len(self.districts), len(self.parties), max_district_seats + 1), dtype = np.int64)
+
+        party_ids = np.arange(len(self.parties))
+        district_party_ids = np.arange(len(self.districts)*len(self.parties))
+        for start in range(0, draws, batch_size):
+            batch_draws = min(batch_size, draws - start)
+            votes = perturb_votes(self.votes, batch_draws, noise = noise, sample_size = sample_size, rng = rng)
+            votes *= self.running
+            party_seats, district_seats = self.evaluate(votes)
+
+            party_seats = np.clip(party_seats, 0, self.num_seats)
+            party_counts += np.bincount((party_ids*(self.num_seats + 1) + party_seats).ravel(),
+                                        minlength = party_counts.size).reshape(party_counts.shape)
+            district_seats = np.clip(district_seats, 0, max_district_seats).reshape(batch_draws, -1)
+            district_counts += np.bincount((district_party_ids*(max_district_seats + 1) + district_seats).ravel(),
+                                           minlength = district_counts.size).reshape(district_counts.shape)
+
+        return SimulationResult(self, draws, party_counts, district_counts)
+
+
+class SimulationResult:
+    def __init__(self, simulation, draws, party_counts, district_counts):
+        self.draws = draws
+        self.parties = simulation.parties
+        self.districts = simulation.districts
+        self.party_names = simulation.norway.party_names
+        self.party_counts = party_counts
+        self.district_counts = district_counts
+
+    def party_probabilities(self):
+        # probability of every seat count for every party that can win a seat
+        probabilities = pd.DataFrame(self.party_counts/self.draws,
+                                     index = [self.party_names.get(party, party) for party in self.parties])
+        probabilities = probabilities.loc[probabilities[0] < 1]
+        return probabilities.loc[:, probabilities.sum(axis = 0) > 0]
+
+    def district_probabilities(self):
+        # probability of every seat count for every party in every district (districts, parties) x seats
+        index = pd.MultiIndex.from_product([self.districts, self.parties], names = ["Valgdistrikt", "Partikode"])
+        probabilities = pd.DataFrame(self.district_counts.reshape(len(index), -1)/self.draws, index = index)
+        probabilities = probabilities.loc[probabilities[0] < 1]
+        return probabilities.loc[:, probabilities.sum(axis = 0) > 0]
+
+    def party_summary(self):
+        seats = np.arange(self.party_counts.shape[1])
+        cumulative = np.cumsum(self.party_counts, axis = 1)/self.draws
+        summary = pd.DataFrame({"Snitt": self.party_counts @ seats/self.draws,
+                                "5%": np.argmax(cumulative >= 0.05, axis = 1),
+                                "Median": np.argmax(cumulative >= 0.5, axis = 1),
+                                "95%": np.argmax(cumulative >= 0.95, axis = 1)},
+                               index = [self.party_names.get(party, party) for party in self.parties])
+        summary = summary.loc[summary["95%"] > 0]
+        return summary.sort_values("Snitt", ascending = False)
+
+    def show(self):
+        print("")
+        print(f"Usikkerhet i mandatfordelingen ({self.draws} trekninger)")
+        print(self.party_summary().round(2))
+        print("")
+        print("Sannsynlighet for antall mandater per parti")
+        print(self.party_probabilities().round(3))
+        print("")
+        print("Sannsynlighet for antall mandater per parti og valgdistrikt")
+        print(self.district_probabilities().round(3))
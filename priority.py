@@ -0,0 +1,134 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from district import apportion, cumulative_seats, priority_sequence
+
+POPULATIONS_FILE = "uspop.csv"
+HOUSE_SIZE = 435
+
+
+def read_populations(filename = POPULATIONS_FILE):
+    # one state per line with its population, separated by ;
+    table = pd.read_csv(filename, sep = ";", header = None, names = ["Stat", "Befolkning"])
+    return dict(zip(table["Stat"], table["Befolkning"]))
+
+
+def read_projections(filename):
+    # one row per state and one column per population projection, with the names of the projections in the first line
+    return pd.read_csv(filename, sep = ";", index_col = 0).T
+
+
+def house_seats(populations, house_size, initial_seats = 1):
+    # Seats per state (last axis) in a house of house_size seats, where every
+    # state starts with initial_seats and the rest go to the highest priority
+    # values, found by a partial sort and a cutoff. With leading axes, every
+    # row of populations is a projection of its own.
+    populations = np.asarray(populations, dtype = float)
+    return apportion(populations, house_size, method = "hunthill", initial_seats = initial_seats, hh_threshold = 0)
+
+
+class PriorityTable:
+    # The priority values of every state and seat up to max_house_size seats,
+    # sorted once like the tables of the US Census Bureau. The seats for any
+    # house size are then the number of values each state has among the first
+    # ones in the table.
+    def __init__(self, populations, max_house_size = 600, initial_seats = 1):
+        self.states = list(populations)
+        self.populations = np.array([populations[state] for state in self.states], dtype = float)
+        self.initial_seats = initial_seats
+        self.first_seat = initial_seats*len(self.states) # the seat in the house the table starts after
+        self.order, self.values = priority_sequence(self.populations, max_house_size - self.first_seat,
+                                                    method = "hunthill", initial_seats = initial_seats)
+        self.counts = cumulative_seats(self.order, len(self.states)) + initial_seats
+
+    @property
+    def max_house_size(self):
+        return self.first_seat + len(self.order)
+
+    def _rows(self, house_sizes):
+        house_sizes = np.asarray(house_sizes, dtype = int)
+        if np.any((house_sizes < self.first_seat) | (house_sizes > self.max_house_size)):
+            raise ValueError(f"House sizes must be between {self.first_seat} and {self.max_house_size}")
+        return house_sizes - self.first_seat
+
+    def seats(self, house_size = HOUSE_SIZE):
+        return pd.Series(self.counts[self._rows(house_size)], index = self.states, name = "Mandater")
+
+    def sweep(self, house_sizes):
+        # seats per state (columns) for every house size (rows)
+        return pd.DataFrame(self.counts[self._rows(house_sizes)], columns = self.states,
+                            index = pd.Index(house_sizes, name = "Mandater"))
+
+    def table(self, last_seat = None):
+        # the seats in the order they are given out, as published by the Census Bureau
+        num_rows = len(self.order) if last_seat is None else self._rows(last_seat)
+        order = self.order[:num_rows]
+        return pd.DataFrame({"Mandat i huset": np.arange(self.first_seat + 1, self.first_seat + num_rows + 1),
+                             "Stat": np.array(self.states, dtype = object)[order],
+                             "Statens mandat": self.counts[np.arange(1, num_rows + 1), order],
+                             "Prioritetsverdi": np.round(self.values[:num_rows]).astype(np.int64)})
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Huntington-Hill apportionment of the US House from a priority value table")
+    parser.add_argument("populations",
+                        help = f"File with the population of every state (default {POPULATIONS_FILE})",
+                        nargs = "?",
+                        default = POPULATIONS_FILE,
+                        type = str)
+    parser.add_argument("-n", "--housesize",
+                        help = f"Number of seats in the house (default {HOUSE_SIZE})",
+                        default = HOUSE_SIZE,
+                        type = int)
+    parser.add_argument("--table",
+                        help = "Show the last NUMROWS seats given out, and the next ones after them",
+                        default = 10,
+                        metavar = "NUMROWS",
+                        type = int)
+    parser.add_argument("--sweep",
+                        help = "Show the seats per state for every house size from MIN to MAX seats",
+                        nargs = 2,
+                        default = None,
+                        metavar = ("MIN", "MAX"),
+                        type = int)
+    parser.add_argument("--projections",
+                        help = "File with population projections to apportion the house for, one column per projection",
+                        default = None,
+                        type = str)
+    args = parser.parse_args()
+
+    populations = read_populations(args.populations)
+    first_seat = len(populations) # every state starts with one seat
+    if args.housesize < first_seat:
+        parser.error(f"--housesize must be at least {first_seat}, the number of states")
+    if args.sweep and not first_seat <= args.sweep[0] <= args.sweep[1]:
+        parser.error(f"--sweep needs {first_seat} <= MIN <= MAX, {first_seat} is the number of states")
+    if args.table < 0:
+        parser.error("--table can't be negative")
+    max_house_size = max(args.housesize + args.table, args.sweep[1] if args.sweep else 0)
+    table = PriorityTable(populations, max_house_size = max_house_size)
+
+    print(f"Mandater per stat med {args.housesize} mandater i huset")
+    print(table.seats(args.housesize).sort_values(ascending = False).to_string())
+    if args.table:
+        print("")
+        print(f"De siste {args.table} mandatene som deles ut, og de neste {args.table} etter dem")
+        last_row = args.housesize - table.first_seat
+        rows = table.table().iloc[max(last_row - args.table, 0):last_row + args.table]
+        print(rows.to_string(index = False))
+    if args.sweep:
+        print("")
+        print(f"Mandater per stat med {args.sweep[0]} til {args.sweep[1]} mandater i huset")
+        print(table.sweep(np.arange(args.sweep[0], args.sweep[1] + 1)).T.to_string())
+    if args.projections:
+        projections = read_projections(args.projections)
+        seats = house_seats(projections.to_numpy(), args.housesize)
+        print("")
+        print(f"Mandater per stat med befolkningsframskrivingene i {args.projections}")
+        print(pd.DataFrame(seats.T, index = projections.columns, columns = projections.index).to_string())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+import hashlib
+import json
+import os
+import pickle
+
+from datacache import file_hash
+
+CACHE_FOLDER = ".resultcache"
+CACHE_VERSION = 1
+# arguments that only change what is shown or where it is saved, not the results
+OUTPUT_ARGUMENTS = ("results", "displaydistricts", "individuals", "runanalyze", "plot", "saveplot", "folder",
+                    "marginal", "sweep", "areasweep", "limitbreakpoints", "montecarlo", "noise", "samplesize", "seed",
+                    "trace", "traceformat", "tracememory", "profile")
+# the modules the results and the figures are made by: election.py and every
+# module it imports at the top, directly or through another module (the ones
+# it imports inside a method only make reports, which aren't cached). A new
+# import there has to be added here too.
+CODE_FILES = ("election.py", "datacache.py", "district.py", "instrument.py", "leveling.py", "priority.py", "votecube.py")
+
+
+class ResultCache:
+    # Calculated elections (as FigureData) on disk, keyed by a hash of the
+    # data files, the code and the arguments that change the results, and a
+    # record of which saved figure came from which key. The files used least
+    # recently are removed when the cache grows past max_bytes.
+    def __init__(self, folder = CACHE_FOLDER, max_bytes = 100*1024**2):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self._index_path = os.path.join(folder, "figures.json")
+        self._figures = None
+
+    def __getstate__(self):
+        # the worker processes only read and write entries, the figure records stay in the main process
+        state = dict(self.__dict__)
+        state["_figures"] = None
+        return state
+
+    def key(self, args, data_files):
+        code_folder = os.path.dirname(os.path.abspath(__file__))
+        arguments = {name: value for name, value in sorted(vars(args).items()) if name not in OUTPUT_ARGUMENTS}
+        key = hashlib.blake2b(digest_size = 16)
+        key.update(f"{CACHE_VERSION};{json.dumps(arguments, sort_keys = True, default = str)};".encode("utf-8"))
+        for filename in CODE_FILES:
+            key.update(file_hash(os.path.join(code_folder, filename)).encode("utf-8"))
+        for filename in data_files:
+            key.update(file_hash(filename).encode("utf-8"))
+        return key.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.folder, f"{key}.pkl")
+
+    def load(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as infile:
+                figure_data = pickle.load(infile)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        os.utime(path) # the eviction goes by the time each entry was last used
+        return figure_data
+
+    def store(self, key, figure_data):
+        # written to a temporary file first, so other processes never read half an entry
+        try:
+            os.makedirs(self.folder, exist_ok = True)
+            temporary_path = f"{self._path(key)}.{os.getpid()}.tmp"
+            with open(temporary_path, "wb") as outfile:
+                pickle.dump(figure_data, outfile, protocol = pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary_path, self._path(key))
+        except OSError:
+            pass # the cache is only an optimization
+
+    def _figure_index(self):
+        if self._figures is None:
+            try:
+                with open(self._index_path, encoding = "utf-8") as infile:
+                    self._figures = json.load(infile)
+            except (OSError, ValueError):
+                self._figures = {}
+        return self._figures
+
+    def figure_is_current(self, path, key):
+        # whether the figure at path was saved from the results with this key, and hasn't been touched since
+        entry = self._figure_index().get(os.path.abspath(path))
+        if entry is None or entry[0] != key:
+            return False
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        return [stat.st_mtime_ns, stat.st_size] == entry[1:]
+
+    def figure_saved(self, path, key):
+        stat = os.stat(path)
+        self._figure_index()[os.path.abspath(path)] = [key, stat.st_mtime_ns, stat.st_size]
+
+    def save(self):
+        # writes the figure records and removes the entries used least recently until the cache fits
+        try:
+            os.makedirs(self.folder, exist_ok = True)
+            entries = []
+            for filename in os.listdir(self.folder):
+                if filename.endswith(".pkl"):
+                    stat = os.stat(os.path.join(self.folder, filename))
+                    entries.append((stat.st_mtime, stat.st_size, filename))
+            total_bytes = sum(size for _, size, _ in entries)
+            for _, size, filename in sorted(entries):
+                if total_bytes <= self.max_bytes:
+                    break
+                os.remove(os.path.join(self.folder, filename))
+                total_bytes -= size
+
+            if self._figures is not None:
+                with open(self._index_path, "w", encoding = "utf-8") as outfile:
+                    json.dump(self._figures, outfile)
+        except OSError:
+            pass
@@ -0,0 +1,155 @@
+import argparse
+import contextlib
+import copy
+import io
+import multiprocessing
+import os
+import shlex
+import time
+
+import matplotlib
+matplotlib.use("Agg") # figures are only saved, never shown
+
+import matplotlib.pyplot as plt
+
+from election import FIGURE_NAMES, FigureData, input_files, parse_args, run
+from resultcache import ResultCache
+
+
+def read_scenarios(filename):
+    # one scenario per line, written with the same flags as election.py,
+    # blank lines and lines starting with # are skipped. Every line is parsed
+    # here, so a bad one is reported before any worker starts.
+    scenarios = []
+    errors = []
+    with open(filename, encoding = "utf-8") as infile:
+        for line_number, line in enumerate(infile, start = 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            messages = io.StringIO()
+            try:
+                with contextlib.redirect_stderr(messages):
+                    scenarios.append(parse_args(shlex.split(line)))
+            except (SystemExit, ValueError) as error:
+                message = messages.getvalue().strip().splitlines()[-1:] or [str(error)]
+                errors.append(f"linje {line_number}: {message[0].split('error: ', 1)[-1]}")
+    if errors:
+        raise ValueError(f"Ugyldige scenarier i {filename}:\n" + "\n".join(errors))
+    return scenarios
+
+
+def run_scenario(task):
+    # the election is calculated here, unless it is in the cache, and its figures are drawn as separate tasks
+    args, cache = task
+    args = copy.copy(args) # the scenario itself stays as it was read
+    start_time = time.perf_counter()
+    plot = args.plot
+    args.plot = False
+    key = cache.key(args, input_files(args)) if cache is not None else None
+    figure_data = cache.load(key) if cache is not None else None
+    if figure_data is not None:
+        figure_data.args = args # the folder and the output flags aren't part of the key
+    else:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            figure_data = FigureData(run(args))
+        if cache is not None:
+            cache.store(key, figure_data)
+    if not plot:
+        figure_data = None
+    return args.folder, figure_data, key, time.perf_counter() - start_time
+
+
+def render_figure(task):
+    figure_data, name = task
+    start_time = time.perf_counter()
+    figure_data._prepare_plots()
+    figure_data.plot_figure(name)
+    plt.close("all")
+    return figure_data.args.folder, name, time.perf_counter() - start_time
+
+
+def run_scenarios(scenarios, jobs = None, cache = None):
+    # The results files and justeringer.ods are parsed once per worker process
+    # and reused by every scenario that worker runs. The scenarios are
+    # calculated first, and then all their figures are drawn in parallel, so
+    # the slow figures of one scenario don't hold up a whole worker. With a
+    # ResultCache, scenarios calculated before are loaded from it, and figures
+    # already saved from the same results are not drawn again.
+    # Yields the folder and the time spent on each scenario, once its last figure is saved.
+    if jobs == 1:
+        pool = None
+        imap = map
+    else:
+        pool = multiprocessing.Pool(jobs)
+        imap = pool.imap_unordered
+
+    try:
+        durations = {}
+        figures_left = {}
+        tasks = []
+        figure_keys = {}
+        for folder, figure_data, key, duration in imap(run_scenario, [(args, cache) for args in scenarios]):
+            durations[folder] = durations.get(folder, 0) + duration
+            names = []
+            if figure_data is not None:
+                for name in FIGURE_NAMES:
+                    path = os.path.join(folder, f"{name}.png")
+                    if cache is None or not cache.figure_is_current(path, key):
+                        names.append(name)
+                        figure_keys[path] = key
+            if not names:
+                yield folder, durations[folder]
+                continue
+            figures_left[folder] = figures_left.get(folder, 0) + len(names)
+            tasks.extend((figure_data, name) for name in names)
+
+        for folder, name, duration in imap(render_figure, tasks):
+            durations[folder] += duration
+            if cache is not None:
+                path = os.path.join(folder, f"{name}.png")
+                cache.figure_saved(path, figure_keys[path])
+            figures_left[folder] -= 1
+            if figures_left[folder] == 0:
+                yield folder, durations[folder]
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        if cache is not None:
+            cache.save()
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Run many election.py scenarios in one go")
+    parser.add_argument("scenarios",
+                        help = "File with one line of election.py arguments per scenario (default scenarios.txt)",
+                        nargs = "?",
+                        default = "scenarios.txt",
+                        type = str)
+    parser.add_argument("-j", "--jobs",
+                        help = "Number of worker processes (default is one per CPU)",
+                        default = None,
+                        type = int)
+    parser.add_argument("--nocache",
+                        help = "Calculate and draw every scenario again, without reading or writing the result cache",
+                        action = "store_true")
+    parser.add_argument("--cachesize",
+                        help = "Largest size of the result cache in MB, the entries used least recently are removed first (default 100)",
+                        default = 100,
+                        type = float)
+    args = parser.parse_args()
+
+    try:
+        scenarios = read_scenarios(args.scenarios)
+    except ValueError as error:
+        parser.error(str(error))
+    cache = None if args.nocache else ResultCache(max_bytes = args.cachesize*1024**2)
+    start_time = time.perf_counter()
+    for folder, duration in run_scenarios(scenarios, jobs = args.jobs, cache = cache):
+        print(f"{folder:60s}  [  ok  ]  ({duration:>7.5f}s)  ")
+    print(f"{len(scenarios)} scenarier ferdig på {time.perf_counter() - start_time:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
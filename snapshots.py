@@ -0,0 +1,234 @@
+import argparse
+import contextlib
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from election import make_election, parse_args, read_results
+from votecube import VoteCube
+
+
+def _sparse_changes(before, after):
+    # the positions and sizes of the changes between two arrays of the same shape
+    changed = np.flatnonzero(before.ravel() != after.ravel())
+    return changed.astype(np.int32), (after.ravel()[changed] - before.ravel()[changed])
+
+
+class SnapshotStore:
+    # A series of result snapshots (a counting night) kept as the vote cube of
+    # the first snapshot and only the changes for every later snapshot. All the
+    # snapshots share the same districts and parties, in order of appearance.
+    def __init__(self, names, district_names, party_codes, party_names, votes, eligibles,
+                 district_parties, vote_changes, eligible_changes, running_changes):
+        self.names = list(names)
+        self.district_names = list(district_names)
+        self.party_codes = list(party_codes)
+        self.party_names = party_names
+        self.votes = votes # votes (districts x parties) and eligible voters in the first snapshot
+        self.eligibles = eligibles
+        self.district_parties = district_parties # parties running in each district in the first snapshot, in listed order
+        # for every later snapshot, (positions, sizes) of the changes from the snapshot before
+        self.vote_changes = vote_changes
+        self.eligible_changes = eligible_changes
+        self.running_changes = running_changes # positions of parties that start running in a district
+
+    def __len__(self):
+        return len(self.names)
+
+    @classmethod
+    def from_files(cls, filenames):
+        cubes = [VoteCube.from_results(read_results(filename)) for filename in filenames]
+        district_names = list(dict.fromkeys(name for cube in cubes for name in cube.district_names))
+        party_codes = list(dict.fromkeys(party for cube in cubes for party in cube.party_codes))
+        party_names = {}
+        for cube in cubes:
+            party_names.update(cube.party_names)
+        district_index = {name: i for i, name in enumerate(district_names)}
+        party_index = {party: i for i, party in enumerate(party_codes)}
+
+        # every snapshot on the shared districts and parties, and the parties running in each district
+        all_votes = []
+        all_eligibles = []
+        all_district_parties = []
+        for cube in cubes:
+            rows = [district_index[name] for name in cube.district_names]
+            columns = np.array([party_index[party] for party in cube.party_codes], dtype = int)
+            votes = np.zeros((len(district_names), len(party_codes)), dtype = np.int64)
+            votes[np.ix_(rows, columns)] = cube.votes
+            eligibles = np.zeros(len(district_names), dtype = np.int64)
+            eligibles[rows] = cube.eligibles
+            district_parties = [np.array([], dtype = int) for _ in district_names]
+            for row, parties in zip(rows, cube.district_parties):
+                district_parties[row] = columns[parties]
+            all_votes.append(votes)
+            all_eligibles.append(eligibles)
+            all_district_parties.append(district_parties)
+
+        vote_changes = []
+        eligible_changes = []
+        running_changes = []
+        for i in range(1, len(cubes)):
+            vote_changes.append(_sparse_changes(all_votes[i - 1], all_votes[i]))
+            eligible_changes.append(_sparse_changes(all_eligibles[i - 1], all_eligibles[i]))
+            running_before = cls._running(all_district_parties[i - 1], len(party_codes))
+            running_now = cls._running(all_district_parties[i], len(party_codes))
+            running_changes.append(np.flatnonzero(running_now & ~running_before).astype(np.int32))
+
+        names = [os.path.splitext(os.path.basename(filename))[0] for filename in filenames]
+        return cls(names, district_names, party_codes, party_names, all_votes[0], all_eligibles[0],
+                   all_district_parties[0], vote_changes, eligible_changes, running_changes)
+
+    @staticmethod
+    def _running(district_parties, num_parties):
+        running = np.zeros((len(district_parties), num_parties), dtype = bool)
+        for row, parties in enumerate(district_parties):
+            running[row, parties] = True
+        return running.ravel()
+
+    def save(self, filename):
+        def concatenated(changes):
+            # the changes of all snapshots after each other, with where each snapshot starts
+            offsets = np.cumsum([0] + [len(positions) for positions in changes])
+            return offsets, np.concatenate([np.zeros(0, dtype = np.int32)] + list(changes))
+
+        vote_offsets, vote_positions = concatenated([positions for positions, _ in self.vote_changes])
+        _, vote_sizes = concatenated([sizes for _, sizes in self.vote_changes])
+        eligible_offsets, eligible_positions = concatenated([positions for positions, _ in self.eligible_changes])
+        _, eligible_sizes = concatenated([sizes for _, sizes in self.eligible_changes])
+        running_offsets, running_positions = concatenated(self.running_changes)
+        party_offsets, district_parties = concatenated(self.district_parties)
+        np.savez_compressed(filename,
+                            names = np.array(self.names, dtype = str),
+                            district_names = np.array(self.district_names, dtype = str),
+                            party_codes = np.array(self.party_codes, dtype = str),
+                            party_names = np.array([self.party_names.get(party, party) for party in self.party_codes], dtype = str),
+                            votes = self.votes,
+                            eligibles = self.eligibles,
+                            party_offsets = party_offsets,
+                            district_parties = district_parties,
+                            vote_offsets = vote_offsets,
+                            vote_positions = vote_positions,
+                            vote_sizes = vote_sizes,
+                            eligible_offsets = eligible_offsets,
+                            eligible_positions = eligible_positions,
+                            eligible_sizes = eligible_sizes,
+                            running_offsets = running_offsets,
+                            running_positions = running_positions)
+
+    @classmethod
+    def load(cls, filename):
+        with np.load(filename, allow_pickle = False) as data:
+            def split(offsets, values):
+                return [values[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+
+            party_codes = data["party_codes"].tolist()
+            vote_positions = split(data["vote_offsets"], data["vote_positions"])
+            vote_sizes = split(data["vote_offsets"], data["vote_sizes"])
+            eligible_positions = split(data["eligible_offsets"], data["eligible_positions"])
+            eligible_sizes = split(data["eligible_offsets"], data["eligible_sizes"])
+            return cls(data["names"].tolist(),
+                       data["district_names"].tolist(),
+                       party_codes,
+                       dict(zip(party_codes, data["party_names"].tolist())),
+                       data["votes"],
+                       data["eligibles"],
+                       split(data["party_offsets"], data["district_parties"].astype(int)),
+                       list(zip(vote_positions, vote_sizes)),
+                       list(zip(eligible_positions, eligible_sizes)),
+                       split(data["running_offsets"], data["running_positions"]))
+
+    def cube(self, snapshot):
+        # the votes of one snapshot, rebuilt from the first one and the changes up to it
+        votes = self.votes.copy()
+        eligibles = self.eligibles.copy()
+        district_parties = [parties.copy() for parties in self.district_parties]
+        for i in range(snapshot):
+            positions, sizes = self.vote_changes[i]
+            votes.ravel()[positions] += sizes
+            positions, sizes = self.eligible_changes[i]
+            eligibles[positions] += sizes
+            for row, party in zip(*np.divmod(self.running_changes[i], len(self.party_codes))):
+                district_parties[row] = np.append(district_parties[row], party)
+        return VoteCube(self.district_names, self.party_codes, votes, eligibles = eligibles,
+                        party_names = self.party_names, district_parties = district_parties)
+
+    def changes(self, snapshot):
+        # the changes from the snapshot before, as {(district, party): votes}
+        # and {district: eligible voters}, and whether any party starts running in a district
+        positions, sizes = self.vote_changes[snapshot - 1]
+        vote_changes = {}
+        for row, column, size in zip(*np.divmod(positions, len(self.party_codes)), sizes.tolist()):
+            vote_changes[(self.district_names[row], self.party_codes[column])] = size
+        positions, sizes = self.eligible_changes[snapshot - 1]
+        eligible_changes = {self.district_names[row]: size for row, size in zip(positions, sizes.tolist())}
+        return vote_changes, eligible_changes, len(self.running_changes[snapshot - 1]) > 0
+
+
+def seat_trajectories(store, args):
+    # Seats per party and per (district, party) after every snapshot, with
+    # the election updated from one snapshot to the next instead of recalculated
+    party_seats = []
+    district_seats = []
+    norway = None
+    for snapshot in range(len(store)):
+        if norway is not None:
+            vote_changes, eligible_changes, new_parties = store.changes(snapshot)
+            if new_parties or not norway.update_votes(vote_changes, eligible_changes):
+                norway = None
+        if norway is None:
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                norway = make_election(args, cube = store.cube(snapshot))
+                norway.calculate(dist_method = args.method, num_seats = 169)
+
+        party_seats.append({party: seats[0] for party, seats in norway.distribution_with_leveling.items()})
+        district_seats.append({(district, party): seats
+                               for district, distribution in norway.district_distributions.items()
+                               for party, seats in distribution.items()})
+
+    party_table = pd.DataFrame(party_seats, index = store.names).fillna(0).astype(int).T
+    party_table.index = [norway.party_names.get(party, party) for party in party_table.index]
+    district_table = pd.DataFrame(district_seats, index = store.names).fillna(0).astype(int).T
+    district_table.index = pd.MultiIndex.from_tuples(district_table.index, names = ["Valgdistrikt", "Partikode"])
+    return party_table, district_table
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Follow the seats through a series of result snapshots. Other arguments are passed on to election.py")
+    parser.add_argument("snapshots",
+                        help = "The results files in order, or a store saved with --save",
+                        nargs = "+",
+                        type = str)
+    parser.add_argument("--save",
+                        help = "Save the snapshots as a compact store (.npz) that can be given instead of the files",
+                        default = None,
+                        metavar = "STORE",
+                        type = str)
+    snapshot_args, election_argv = parser.parse_known_args()
+    args = parse_args(election_argv)
+
+    start_time = time.perf_counter()
+    if len(snapshot_args.snapshots) == 1 and snapshot_args.snapshots[0].endswith(".npz"):
+        store = SnapshotStore.load(snapshot_args.snapshots[0])
+    else:
+        store = SnapshotStore.from_files(snapshot_args.snapshots)
+    if snapshot_args.save:
+        store.save(snapshot_args.save)
+        print(f"{len(store)} øyeblikksbilder lagret i {snapshot_args.save} ({os.path.getsize(snapshot_args.save)/1024:.1f} kB)")
+
+    party_table, district_table = seat_trajectories(store, args)
+    print(f"Mandater etter hvert øyeblikksbilde ({len(store)} filer på {time.perf_counter() - start_time:.3f}s)")
+    print(party_table.to_string())
+    if args.displaydistricts or args.individuals:
+        individuals_lowered = [name.lower() for name in args.individuals]
+        for district in district_table.index.unique(level = "Valgdistrikt"):
+            if args.individuals and district.lower() not in individuals_lowered:
+                continue
+            print("")
+            print(district)
+            print(district_table.loc[district].to_string())
+
+
+if __name__ == "__main__":
+    main()
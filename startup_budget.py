@@ -0,0 +1,85 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# modules a results-only run should never import
+HEAVY_MODULES = ("matplotlib", "odf", "montecarlo", "marginal")
+
+LOADED_MODULES_SCRIPT = """
+import contextlib, os, sys
+from election import parse_args, run
+with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+    run(parse_args(sys.argv[1:]))
+print(" ".join(sorted({name.split(".")[0] for name in sys.modules if name.startswith({heavy})})))
+"""
+
+IMPORT_TIME_SCRIPT = """
+import time
+start_time = time.perf_counter()
+import election
+print(time.perf_counter() - start_time)
+"""
+
+
+def time_command(command, repeats):
+    durations = []
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        subprocess.run(command, check = True, stdout = subprocess.DEVNULL)
+        durations.append(time.perf_counter() - start_time)
+    return durations
+
+
+def import_time(repeats):
+    durations = []
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable, "-c", IMPORT_TIME_SCRIPT], check = True,
+                                capture_output = True, text = True).stdout
+        durations.append(float(output))
+    return durations
+
+
+def loaded_heavy_modules(election_args):
+    script = LOADED_MODULES_SCRIPT.replace("{heavy}", repr(HEAVY_MODULES))
+    output = subprocess.run([sys.executable, "-c", script] + election_args, check = True,
+                            capture_output = True, text = True).stdout
+    return output.split()
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Measure the startup time of a results-only election.py run against a budget")
+    parser.add_argument("-b", "--budget",
+                        help = "Largest allowed median time in seconds for the whole run (default 1.0)",
+                        default = 1.0,
+                        type = float)
+    parser.add_argument("-n", "--repeats",
+                        help = "Number of runs to take the median of (default 5)",
+                        default = 5,
+                        type = int)
+    parser.add_argument("election_args",
+                        help = "Arguments for election.py (default -r)",
+                        nargs = "*",
+                        default = ["-r"])
+    args = parser.parse_args()
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+    interpreter = statistics.median(time_command([sys.executable, "-c", "pass"], args.repeats))
+    imports = statistics.median(import_time(args.repeats))
+    total = statistics.median(time_command([sys.executable, "election.py"] + args.election_args, args.repeats))
+    heavy = loaded_heavy_modules(args.election_args)
+
+    print(f"Python oppstart:          {interpreter:>7.3f}s")
+    print(f"import election:          {imports:>7.3f}s")
+    print(f"election.py {' '.join(args.election_args):12s} {total:>7.3f}s  (budsjett {args.budget:.3f}s)")
+    if heavy:
+        print(f"Lastet unødvendige moduler: {', '.join(heavy)}")
+
+    if total > args.budget or heavy:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
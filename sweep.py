@@ -0,0 +1,113 @@
+import numpy as np
+import pandas as pd
+
+from district import apportion, cumulative_seats, priority_sequence
+from leveling import solve_leveling
+
+
+class SeatSweep:
+    # The seats per party for a whole range of parliament sizes, from a
+    # calculated Norway model. With a divisor method, the seats of a larger
+    # parliament only extend those of a smaller one, so the order the seats are
+    # won in is worked out once, for the districts and for the parties in every
+    # district, and each size is read off it. The national leveling stage
+    # reuses one priority sequence for every set of leveling parties.
+    def __init__(self, norway):
+        args = norway.args
+        self.norway = norway
+        self.districts = list(norway.electoral_districts)
+        self.direct_parties = list(norway.direct_parties)
+        self.votes = norway.direct_votes
+        self.competing = norway.direct_competing
+        self.method = args.method
+        self.initial_divisor = args.initialdivisor
+        self.usadist = args.usadist
+        self.leveling_limit = args.levelinglimit
+        self.singleseatleveling = args.singleseatleveling
+        if args.method == "dhondt":
+            self.leveling_method = "dhondt"
+        else:
+            self.leveling_method = "stlague"
+        self.num_leveling_seats = norway.num_leveling_seats
+        self.only_leveling = norway.num_leveling_seats >= norway._num_seats # a single district with only leveling seats
+
+        # the district scores in the order they were added to the seat distribution, since ties go by that order
+        self.score_districts = list(norway.populations)
+        self.scores = np.array([norway.dist_areas[name]*args.areamultiplier + norway.populations[name]
+                                for name in self.score_districts], dtype = float)
+        self.score_columns = np.array([self.score_districts.index(name) for name in self.districts])
+
+        # the national stage goes through the parties in the order of party_votes_total, like Norway does
+        self.parties = [party for party in norway.party_votes_total if party != "BLANKE" or args.blankparty]
+        self.party_columns = np.array([self.direct_parties.index(party) if party in self.direct_parties else -1
+                                       for party in self.parties])
+        self.party_votes = np.array([norway.party_votes_total[party] for party in self.parties], dtype = float)
+        self.party_shares = norway.vote_share(self.party_votes)
+
+    def district_seats(self, sizes):
+        # seats per district for every size, sizes x districts
+        sizes = np.asarray(sizes, dtype = int)
+        num_districts = len(self.scores)
+        if self.usadist:
+            # every district starts with three seats, one of them from Huntington-Hill
+            handed_out = sizes - 3*num_districts
+            order, _ = priority_sequence(self.scores, int(np.max(handed_out, initial = 0)),
+                                         method = "hunthill", initial_seats = 1)
+            extra_seats = 3
+        else:
+            method = "dhondt" if self.method == "dhondt" else "stlague"
+            handed_out = sizes
+            order, _ = priority_sequence(self.scores, int(np.max(sizes, initial = 0)), method = method, initial_divisor = 1)
+            extra_seats = 0
+        seats = cumulative_seats(order, num_districts)[np.clip(handed_out, 0, len(order))] + extra_seats
+        return seats[:, self.score_columns]
+
+    def direct_seats(self, district_seats):
+        # direct seats per district and party for every size, sizes x districts x parties
+        if self.only_leveling:
+            seats_without_leveling = np.zeros(district_seats.shape, dtype = int)
+        else:
+            seats_without_leveling = district_seats - self.num_leveling_seats
+
+        # Huntington-Hill and first past the post are not pure divisor methods
+        if self.method not in ("stlague", "dhondt"):
+            votes = np.broadcast_to(self.votes, seats_without_leveling.shape + self.votes.shape[-1:])
+            return apportion(votes, seats_without_leveling, method = self.method,
+                             initial_divisor = self.initial_divisor, present = self.competing)
+
+        seats = np.zeros(seats_without_leveling.shape + self.votes.shape[-1:], dtype = int)
+        for i in range(len(self.districts)):
+            columns = np.flatnonzero(self.competing[i])
+            if not len(columns):
+                continue
+            order, _ = priority_sequence(self.votes[i, columns], int(np.max(seats_without_leveling[:, i], initial = 0)),
+                                         method = self.method, initial_divisor = self.initial_divisor)
+            table = cumulative_seats(order, len(columns))
+            seats[:, i, columns] = table[np.clip(seats_without_leveling[:, i], 0, len(order))]
+        return seats
+
+    def sweep(self, sizes):
+        # total seats per party (columns) for every parliament size (rows)
+        sizes = np.asarray(sizes, dtype = int)
+        direct_seats = np.sum(self.direct_seats(self.district_seats(sizes)), axis = 1)
+        direct_seats = np.where(self.party_columns >= 0, direct_seats[:, self.party_columns], 0)
+
+        seats = direct_seats.copy()
+        orders = {} # the priority sequence of every set of leveling parties met so far
+        for row, num_seats in enumerate(sizes.tolist()):
+            leveling = self.party_shares >= self.leveling_limit
+            if self.singleseatleveling:
+                leveling |= direct_seats[row] >= 1
+            leveling_seats = num_seats - int(np.sum(direct_seats[row][~leveling]))
+            key = leveling.tobytes()
+            if key not in orders:
+                orders[key], _ = priority_sequence(self.party_votes[leveling], int(np.max(sizes)),
+                                                   method = self.leveling_method)
+            party_seats, kept = solve_leveling(self.party_votes[leveling], direct_seats[row][leveling], leveling_seats,
+                                               method = self.leveling_method, order = orders[key])
+            seats[row, leveling] = np.where(kept, party_seats, direct_seats[row][leveling])
+
+        table = pd.DataFrame(seats, index = pd.Index(sizes, name = "Mandater"),
+                             columns = [self.norway.party_names[party] for party in self.parties])
+        table = table.loc[:, table.sum(axis = 0) > 0]
+        return table[table.sum(axis = 0).sort_values(ascending = False).index]
@@ -0,0 +1,33 @@
+import os
+import sys
+
+import pytest
+
+REPO_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_FOLDER)
+# the final results aren't in the repository, the last count that is stands in for them
+FALLBACK_RESULTS_FILE = "2021-09-17_partydist.csv"
+
+
+@pytest.fixture(autouse = True)
+def repo_folder(monkeypatch):
+    # the data files are read relative to the working folder, like when election.py is run
+    monkeypatch.chdir(REPO_FOLDER)
+
+
+@pytest.fixture
+def results_file():
+    from election import RESULTS_FILE
+    return RESULTS_FILE if os.path.exists(RESULTS_FILE) else FALLBACK_RESULTS_FILE
+
+
+@pytest.fixture
+def calculated(results_file):
+    from election import make_election, parse_args
+
+    def calculated(argv):
+        args = parse_args(argv)
+        norway = make_election(args, filename = None if args.newcounties else results_file)
+        norway.calculate(dist_method = args.method, num_seats = 169)
+        return norway
+    return calculated
@@ -0,0 +1,32 @@
+import os
+
+from datacache import CACHE_FOLDER, read_csv_cached
+
+
+def test_stale_files_are_removed_per_reader(tmp_path):
+    results = tmp_path / "results.csv"
+    results.write_text("a;b\n1;2,5\n", encoding = "utf-8")
+    read_csv_cached(str(results))
+    folder = tmp_path / CACHE_FOLDER
+    legacy = folder / f"results.csv-{'0'*32}.npz"
+    legacy.write_bytes(b"")
+    other_reader = folder / "results.csv-ffffffff-00000000000000000000000000000000.npz"
+    other_reader.write_bytes(b"")
+    (current,) = [name for name in os.listdir(folder) if name.startswith("results.csv-")
+                  and name not in (legacy.name, other_reader.name)]
+    outdated = folder / f"{current[:-len('.npz') - 32]}{'1'*32}.npz" # an older version of the file, same reader
+    outdated.write_bytes(b"")
+
+    frame = read_csv_cached(str(results))
+    assert frame["b"].tolist() == [2.5]
+    assert sorted(os.listdir(folder)) == sorted([current, other_reader.name])
+
+
+def test_damaged_file_is_read_again(tmp_path):
+    results = tmp_path / "results.csv"
+    results.write_text("a;b\n1;2\n", encoding = "utf-8")
+    read_csv_cached(str(results))
+    folder = tmp_path / CACHE_FOLDER
+    for name in os.listdir(folder):
+        (folder / name).write_bytes(b"damaged")
+    assert read_csv_cached(str(results))["a"].tolist() == [1]
@@ -0,0 +1,26 @@
+import pytest
+
+from election import Norway, parse_args
+
+
+def test_unknown_district_in_merge_map_is_a_usage_error(tmp_path, capsys):
+    merge_map = tmp_path / "merge.csv"
+    merge_map.write_text("Fylkenavn;Valgdistrikt\nOslo;Hovedstaden\nOsloo;Hovedstaden\n", encoding = "utf-8")
+    with pytest.raises(SystemExit):
+        parse_args(["--mergemap", str(merge_map)])
+    assert "Osloo" in capsys.readouterr().err
+
+
+def test_merged_districts_keep_added_votes(results_file):
+    mapping = {"Oslo": "Hovedstaden", "Akershus": "Hovedstaden"}
+    plain = Norway(parse_args([]), filename = results_file)
+    plain.merge_districts(mapping)
+    plain.calculate()
+
+    norway = Norway(parse_args([]), filename = results_file)
+    norway.add_votes("Oslo", "V", 1000)
+    norway.add_votes("Akershus", "V", 500)
+    norway.merge_districts(mapping)
+    norway.calculate()
+    assert norway.party_votes_total["V"] - plain.party_votes_total["V"] == 1500
+    assert norway.district_votes_distributions["Hovedstaden"]["V"] - plain.district_votes_distributions["Hovedstaden"]["V"] == 1500
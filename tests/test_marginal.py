@@ -0,0 +1,13 @@
+from marginal import leveling_seat_margins, marginal_seats
+
+
+def test_leveling_seat_that_cannot_flip():
+    # without seats in the district every rest quotient is 0, so no number of votes moves the seat
+    margins = leveling_seat_margins([[10, 5]], [[1, 1]], [15], [0], awards = [0], seats_to_award = [1, 1],
+                                    max_votes = 15)
+    assert margins == []
+
+
+def test_only_leveling_seats_without_limit(calculated):
+    table = marginal_seats(calculated(["-O", "-l", "0"]))
+    assert not (table["Mandat"] == "Utjevning").any()
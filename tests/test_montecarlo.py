@@ -0,0 +1,12 @@
+import numpy as np
+
+from montecarlo import SeatSimulation
+
+
+def test_only_leveling_seats_without_limit(calculated):
+    # with -O no district has seats of its own, so the district seat table only has room for the leveling seat
+    norway = calculated(["-O", "-l", "0"])
+    result = SeatSimulation(norway).simulate(100, seed = 0)
+    assert np.all(result.party_counts.sum(axis = 1) == 100)
+    assert result.district_counts.shape[-1] == 2
+    assert np.all(result.district_counts.sum(axis = -1) == 100)
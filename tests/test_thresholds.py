@@ -0,0 +1,20 @@
+import numpy as np
+import pytest
+
+from thresholds import limit_seats
+
+
+@pytest.mark.parametrize("argv", [["-H"], ["-n", "-H"], ["-m", "dhondt", "-i", "1", "-H"]])
+def test_hardlimit_intervals_match_a_full_calculation(calculated, argv):
+    norway = calculated(argv)
+    table = limit_seats(norway)
+    assert np.all(table["Over (%)"] < table["Til og med (%)"])
+
+    party_columns = list(table.columns[2:])
+    for _, row in table.iterrows():
+        lower, upper = row["Over (%)"], row["Til og med (%)"]
+        limit = upper - 1 if np.isinf(lower) else (lower + upper)/2
+        model = calculated(argv + ["-l", repr(float(limit))])
+        seats = {norway.party_names[party]: values[0] for party, values in model.distribution_with_leveling.items()}
+        assert {name: seats.get(name, 0) for name in party_columns} == row[party_columns].to_dict()
+        assert sum(seats.values()) == sum(row[party_columns])
@@ -0,0 +1,66 @@
+import copy
+
+import numpy as np
+import pandas as pd
+
+
+def limit_breakpoints(norway):
+    # The leveling limits where the seats can change. The limit is only ever
+    # compared with the national vote shares of the parties (a share at or
+    # above the limit gives leveling seats, and with the hard limit a share
+    # below it takes away the direct seats too), so the breakpoints are those
+    # shares, worked out the same way as in the calculation.
+    args = norway.args
+    shares = {float(norway.vote_share(votes)) for party, votes in norway.party_votes_total.items()
+              if party != "BLANKE" or args.blankparty}
+    if args.hardlimit:
+        shares |= norway.hardlimit_shares
+    return np.array(sorted(shares))
+
+
+def limit_seats(norway, breakpoints = None):
+    # The seats per party as a function of the leveling limit, for a
+    # calculated Norway model, with one row per interval of limits that give
+    # the same seats. Every limit above one breakpoint and up to the next
+    # gives the same seats as the next breakpoint itself, so the party seats
+    # are calculated once per breakpoint, and once above the highest one, on a
+    # copy of the model. Without the hard limit, the direct seats don't depend
+    # on the limit, and only the national leveling stage is calculated again.
+    # Limits where the seats don't add up to the size of the parliament (above
+    # every party's share, or with the hard limit where every party is below
+    # it) have no valid outcome, and their intervals are left out.
+    if breakpoints is None:
+        breakpoints = limit_breakpoints(norway)
+    breakpoints = np.asarray(breakpoints, dtype = float)
+    limits = np.append(breakpoints, np.nextafter(breakpoints[-1], np.inf) if len(breakpoints) else 0.0)
+
+    model = copy.copy(norway)
+    model.args = copy.copy(norway.args)
+    rows = []
+    for limit in limits.tolist():
+        model.args.levelinglimit = limit
+        if model.args.hardlimit:
+            model.total_votes = np.sum(model.cube.votes)
+            model._calculate_blanks()
+            model._calculate_direct_seats(method = model.dist_method)
+        model._calculate_leveling_seats_parties(num_seats = model._num_seats)
+        rows.append({party: values[0] for party, values in model.distribution_with_leveling.items()})
+
+    seats = pd.DataFrame(rows).fillna(0).astype(int)
+    valid = (seats.sum(axis = 1) == model._num_seats).to_numpy()
+    intervals = np.flatnonzero(valid)
+    seats = seats[valid].reset_index(drop = True)
+    seats.columns = [norway.party_names[party] for party in seats.columns]
+    seats = seats.loc[:, seats.max(axis = 0) > 0]
+    seats = seats[seats.max(axis = 0).sort_values(ascending = False, kind = "stable").index]
+
+    # neighbouring intervals with the same seats are joined
+    lower = np.append(-np.inf, breakpoints)[intervals]
+    upper = np.append(breakpoints, np.inf)[intervals]
+    changes = np.append(True, np.any(np.diff(seats.to_numpy(), axis = 0) != 0, axis = 1) | (np.diff(intervals) > 1))
+    starts = np.flatnonzero(changes)
+    ends = np.append(starts[1:], len(seats)) - 1
+    table = seats.iloc[starts].reset_index(drop = True)
+    table.insert(0, "Over (%)", lower[starts])
+    table.insert(1, "Til og med (%)", upper[ends])
+    return table
@@ -1,17 +1,22 @@
-import matplotlib.font_manager as font_manager
-import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 
-from district import District
+from datacache import read_csv_cached
+from district import District, apportion
 from election import Norway, parse_args
+from leveling import assign_leveling_seats, level_parties
+from priority import house_seats
+from votecube import VoteCube
 
 
 class USA(Norway):
     def __init__(self, args, filename = "./usa/president_county_candidate.csv", num_leveling_seats = 1):
         self._active_message = False
         self.args = args
-        self.results = pd.read_csv(filename, delimiter = ",")
+        self.results = read_csv_cached(filename, delimiter = ",", decimal = ".")
+        self.cube = VoteCube.from_results(self.results, district_column = "state", party_column = "candidate",
+                                          votes_column = "total_votes", eligibles_column = None,
+                                          name_column = None)
 
         poparea = pd.read_csv("./usa/poparea.csv")
 
@@ -44,27 +49,26 @@ class USA(Norway):
         self.candidates_left_to_right = candidates_left_to_right
         self.locations = locations
 
-        self.total_votes = self.results["total_votes"].sum()
+        self.total_votes = np.sum(self.cube.votes)
 
     def _calculate_seat_distribution(self):
         if self.args.usadist:
-            seat_distribution = District(538 - 2*len(self.populations.items()),
-                                         method = "hunthill", initial_seats = 1)
+            # Huntington-Hill with one seat to start with, and two more for every state, like the electoral college
+            scores = {district_name: self.dist_areas[district_name]*self.args.areamultiplier + population
+                      for district_name, population in self.populations.items()}
+            seats = house_seats(list(scores.values()), 538 - 2*len(scores))
+            self.total_seats = {district_name: int(district_seats) + 2 for district_name, district_seats in zip(scores, seats)}
         else:
             seat_distribution = District(538, initial_divisor = 1)
 
-        for district_name, population in self.populations.items():
-            area = self.dist_areas[district_name]
-    
-            score = area*self.args.areamultiplier + population
-            seat_distribution.add_votes(district_name, score)
-    
-        # Seat distribution per district name
-        self.total_seats = seat_distribution.calculate()
+            for district_name, population in self.populations.items():
+                area = self.dist_areas[district_name]
 
-        if self.args.usadist:
-            for district_name, seats in self.total_seats.items():
-                self.total_seats[district_name] = seats + 2
+                score = area*self.args.areamultiplier + population
+                seat_distribution.add_votes(district_name, score)
+
+            # Seat distribution per district name
+            self.total_seats = seat_distribution.calculate()
 
         self.seats_without_leveling = {}
         s = 0 # check that the total is 538 as well
@@ -74,7 +78,7 @@ class USA(Norway):
         assert s == 538 # check that the total is 538 as well
 
     def _calculate_direct_seats(self, method = "stlague"):
-        results = self.results
+        cube = self.cube
         seats_without_leveling = self.seats_without_leveling
 
         candidate_votes_total = {}
@@ -82,42 +86,56 @@ class USA(Norway):
         distribution = {}
         state_distributions = {}
         state_votes_distributions = {}
+        states = list(self.populations.keys())
 
-        for state in self.populations.keys():
-            results_state = results[results["state"] == state]
-            candidates = results_state.candidate.unique()
-
+        for state in states:
             state_votes = {}
+            if state not in cube.district_index:
+                state_votes_distributions[state] = state_votes
+                continue
+            state_idx = cube.district_index[state]
 
-            electoral_district = District(seats_without_leveling[state],
-                                          initial_divisor = self.args.initialdivisor,
-                                          method = method)
-            
-            for candidate in candidates:
+            for cand_idx in cube.district_parties[state_idx]:
+                candidate = cube.party_codes[cand_idx]
                 if candidate not in candidate_names:
                     candidate_names.append(candidate)
-                results_state_candidate = results_state[results_state["candidate"] == candidate]
-                votes_state_candidate = results_state_candidate["total_votes"].sum()
+                votes_state_candidate = cube.votes[state_idx, cand_idx]
 
                 state_votes[candidate] = votes_state_candidate
-                electoral_district.add_votes(candidate, votes_state_candidate)
 
                 if candidate in candidate_votes_total:
                     candidate_votes_total[candidate] += votes_state_candidate
                 else:
                     candidate_votes_total[candidate] = votes_state_candidate
 
-            state_distribution = electoral_district.calculate()
-            state_distributions[state] = state_distribution
             state_votes_distributions[state] = state_votes
 
-            for cand, seats in state_distribution.items():
+        # apportion the electoral votes in every state at once
+        votes_matrix = np.zeros((len(states), len(candidate_names)))
+        running = np.zeros(votes_matrix.shape, dtype = bool)
+        for i, state in enumerate(states):
+            for candidate, votes in state_votes_distributions[state].items():
+                votes_matrix[i, candidate_names.index(candidate)] = votes
+                running[i, candidate_names.index(candidate)] = True
+
+        seats_matrix = apportion(votes_matrix,
+                                 [seats_without_leveling[state] for state in states],
+                                 method = method,
+                                 initial_divisor = self.args.initialdivisor,
+                                 present = running)
+
+        for state, state_seats in zip(states, seats_matrix):
+            state_distribution = {}
+            for candidate in state_votes_distributions[state]:
+                seats = int(state_seats[candidate_names.index(candidate)])
+                state_distribution[candidate] = seats
                 if not seats:
                     continue
-                if cand in distribution:
-                    distribution[cand] += seats
+                if candidate in distribution:
+                    distribution[candidate] += seats
                 else:
-                    distribution[cand] = seats
+                    distribution[candidate] = seats
+            state_distributions[state] = state_distribution
             
         self.candidate_votes_total = candidate_votes_total
         self.candidate_names = candidate_names
@@ -149,27 +167,7 @@ class USA(Norway):
             else:
                 leveling_seats -= seats
 
-        leveling_district = District(leveling_seats)
-        for cand, votes in cand_competing_votes.items():
-            leveling_district.add_votes(cand, votes)
-        
-        leveling_distribution = leveling_district.calculate()
-
-        cands_over = None
-        while cands_over or cands_over is None:
-            cands_over = []
-
-            for cand, level_seats in leveling_distribution.items():
-                if cand in self.distribution:
-                    state_seats = self.distribution[cand]
-                else:
-                    state_seats = 0
-                if state_seats >= level_seats:
-                    cands_over.append(cand)
-                    leveling_district.remove_party(cand)
-                    leveling_district.seats = leveling_district.seats - state_seats
-            
-            leveling_distribution = leveling_district.calculate()
+        leveling_distribution = level_parties(cand_competing_votes, self.distribution, leveling_seats)
 
         distribution_with_leveling = {}
 
@@ -194,51 +192,34 @@ class USA(Norway):
         self.candidate_vote_shares = cand_vote_shares
 
     def _calculate_leveling_seats_districts(self):
-        leveling_table = []        
-        seats_without_leveling = self.seats_without_leveling
         leveling_distribution = self.leveling_distribution
         state_distributions = self.state_distributions
         distribution = self.distribution
-        results = self.results
-
-        for state in self.populations.keys():
-            results_state = results[results["state"] == state]
-            state_votes_total = results_state["total_votes"].sum()
-            state_divisor = state_votes_total/self.total_seats[state]
-            for cand, level_seats in leveling_distribution.items():
-                cand_state_votes = results_state[results_state["candidate"] == cand]
-                cand_state_votes = np.sum(cand_state_votes["total_votes"])
-                if cand in state_distributions[state]:
-                    direct_seats_in_state = state_distributions[state][cand]
-                else:
-                    direct_seats_in_state = 0
-                divisor = direct_seats_in_state*2 + 1
-                rest_quotient = (cand_state_votes/divisor)/state_divisor
-                leveling_table.append([rest_quotient, state, cand])
-        leveling_table = pd.DataFrame(leveling_table)
-        if len(leveling_table) > 0:
-            leveling_table.columns = ["quotient", "state", "candidate"]
-            leveling_table = leveling_table.sort_values(by = "quotient", ascending = False)
-        
-        cands_awarded = {}
-        leveling_awards = {}
+        cube = self.cube
+
+        # rest quotients for every state and every candidate with leveling seats
+        states = list(self.populations.keys())
+        leveling_cands = list(leveling_distribution)
+        all_cand_votes = np.zeros((len(states), len(cube.party_codes)), dtype = np.int64)
+        cand_state_votes = np.zeros((len(states), len(leveling_cands)), dtype = np.int64)
+        leveling_cand_votes = cube.party_votes_matrix(leveling_cands)
+        for i, state in enumerate(states):
+            if state in cube.district_index:
+                all_cand_votes[i] = cube.votes[cube.district_index[state]]
+                cand_state_votes[i] = leveling_cand_votes[cube.district_index[state]]
+        state_seats = np.array([self.total_seats[state] for state in states])
+        direct_seats_in_state = np.array([[state_distributions[state].get(cand, 0) for cand in leveling_cands]
+                                          for state in states], dtype = int).reshape(cand_state_votes.shape)
+        divisors = direct_seats_in_state*2 + 1
+        with np.errstate(divide = "ignore", invalid = "ignore"):
+            state_divisors = np.sum(all_cand_votes, axis = 1)/state_seats
+            rest_quotients = (cand_state_votes/divisors)/state_divisors[:, None]
+
+        seats_to_award = [leveling_distribution[cand] - distribution.get(cand, 0) for cand in leveling_cands]
 
-        for line in leveling_table.iterrows():
-            state = line[1]["state"]
-            cand = line[1]["candidate"]
-            if cand in distribution:
-                seats_to_award = leveling_distribution[cand] - distribution[cand]
-            else:
-                seats_to_award = leveling_distribution[cand]
-            if state in leveling_awards:
-                continue
-            if cand in cands_awarded:
-                if cands_awarded[cand] >= seats_to_award:
-                    continue
-            else:
-                cands_awarded[cand] = 0
-            leveling_awards[state] = cand
-            cands_awarded[cand] += 1
+        leveling_awards = {}
+        for state_idx, cand_idx in assign_leveling_seats(rest_quotients, seats_to_award):
+            leveling_awards[states[state_idx]] = leveling_cands[cand_idx]
 
         for state, cand in leveling_awards.items():
             if cand in state_distributions[state]:
@@ -309,9 +290,6 @@ class USA(Norway):
         self._message_end()
         self._make_distribution_table()
 
-        self._legend_font = font_manager.FontProperties(family = "Noto Sans",
-                                                        size = 9)
-
     def plot_map(self):
         self.party_names = {}
         for name in self.candidate_names:
@@ -334,6 +312,7 @@ def main():
     if args.displaydistricts or args.individuals:
         usa.show_individual_districts()
 
+    import matplotlib.pyplot as plt
     usa.plot_parliament()
     usa.plot_map()
     plt.show()
@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+
+
+class VoteCube:
+    # Votes aggregated once per (district, party), so the calculation stages
+    # can index arrays instead of filtering the raw results over and over.
+    def __init__(self, district_names, party_codes, votes, eligibles = None,
+                 party_names = None, district_parties = None):
+        self.district_names = list(district_names)
+        self.party_codes = list(party_codes)
+        self.votes = np.asarray(votes, dtype = np.int64)
+        if eligibles is None:
+            eligibles = np.zeros(len(self.district_names), dtype = np.int64)
+        self.eligibles = np.asarray(eligibles, dtype = np.int64)
+        if party_names is None:
+            party_names = {party: party for party in self.party_codes}
+        self.party_names = party_names
+        if district_parties is None:
+            district_parties = [np.flatnonzero(row) for row in self.votes]
+        # parties running in each district, in the order they are listed in the results
+        self.district_parties = district_parties
+
+        self.district_index = {name: i for i, name in enumerate(self.district_names)}
+        self.party_index = {party: i for i, party in enumerate(self.party_codes)}
+
+    @classmethod
+    def from_results(cls, results, district_column = "Fylkenavn", party_column = "Partikode",
+                     votes_column = "Antall stemmer totalt", eligibles_column = "Antall stemmeberettigede",
+                     name_column = "Partinavn", station_columns = ("Fylkenummer", "Kommunenummer", "Stemmekretsnummer")):
+        district_ids, district_names = pd.factorize(results[district_column])
+        party_ids, party_codes = pd.factorize(results[party_column])
+        num_districts = len(district_names)
+        num_parties = len(party_codes)
+
+        cells = district_ids*num_parties + party_ids
+        votes = np.bincount(cells, weights = results[votes_column].to_numpy(),
+                            minlength = num_districts*num_parties)
+        votes = np.rint(votes).astype(np.int64).reshape(num_districts, num_parties)
+
+        # first row each party appears on in each district, to keep the listed order
+        first_row = np.full(num_districts*num_parties, len(results))
+        np.minimum.at(first_row, cells, np.arange(len(results)))
+        first_row = first_row.reshape(num_districts, num_parties)
+        district_parties = []
+        for row in first_row:
+            running = np.flatnonzero(row < len(results))
+            district_parties.append(running[np.argsort(row[running], kind = "stable")])
+
+        eligibles = None
+        if eligibles_column is not None:
+            # the number of eligible voters is repeated on every party row of a polling station
+            station_columns = [column for column in station_columns if column in results.columns]
+            stations = results.assign(_district = district_ids)
+            stations = stations.drop_duplicates(subset = ["_district"] + station_columns)
+            eligibles = np.bincount(stations["_district"].to_numpy(),
+                                    weights = stations[eligibles_column].to_numpy(),
+                                    minlength = num_districts)
+            eligibles = np.rint(eligibles).astype(np.int64)
+
+        party_names = None
+        if name_column is not None:
+            names = results.groupby(party_column, sort = False)[name_column].unique()
+            assert names.map(len).max() == 1 # check that only one party name belongs to the party code
+            party_names = {party: names[party][0] for party in party_codes}
+
+        return cls(district_names, party_codes, votes, eligibles = eligibles,
+                   party_names = party_names, district_parties = district_parties)
+
+    def party_votes(self, party):
+        if party not in self.party_index:
+            return np.zeros(len(self.district_names), dtype = np.int64)
+        return self.votes[:, self.party_index[party]]
+
+    def party_votes_matrix(self, parties):
+        # districts x parties, with zero votes for parties that are not in the results
+        votes = np.zeros((len(self.district_names), len(parties)), dtype = np.int64)
+        for col, party in enumerate(parties):
+            if party in self.party_index:
+                votes[:, col] = self.votes[:, self.party_index[party]]
+        return votes
+
+    def merge(self, mapping):
+        # Combine districts into new ones, mapping is old name -> new name.
+        # Districts missing from the mapping are kept as they are.
+        merged_ids, merged_names = pd.factorize(pd.Series([mapping.get(name, name) for name in self.district_names]))
+
+        votes = np.zeros((len(merged_names), len(self.party_codes)), dtype = np.int64)
+        np.add.at(votes, merged_ids, self.votes)
+        eligibles = np.zeros(len(merged_names), dtype = np.int64)
+        np.add.at(eligibles, merged_ids, self.eligibles)
+
+        district_parties = []
+        for merged_id in range(len(merged_names)):
+            parties = np.concatenate([self.district_parties[dis_idx] for dis_idx in np.flatnonzero(merged_ids == merged_id)])
+            _, first = np.unique(parties, return_index = True)
+            district_parties.append(parties[np.sort(first)])
+
+        return VoteCube(merged_names, self.party_codes, votes, eligibles = eligibles,
+                        party_names = self.party_names, district_parties = district_parties)
@@ -0,0 +1,170 @@
+import argparse
+import glob
+import io
+import os
+import time
+
+import pandas as pd
+
+from election import make_election, parse_args
+
+KEY_FIELDS = 7 # Fylkenummer to Partikode identify a row in a results file
+STATION_FIELDS = 6 # Fylkenummer to Stemmekretsnavn identify a polling station
+
+
+class SnapshotReader:
+    # Keeps the rows of the previous snapshot of a results file, so only the
+    # rows that changed in the next snapshot have to be parsed
+    def __init__(self):
+        self.lines = {} # row key -> line
+        self.votes = {} # row key -> (district, party, votes)
+        self.eligibles = {} # station key -> (district, eligible voters)
+
+    def read(self, filename):
+        # returns the changes in votes per (district, party), in eligible
+        # voters per district and the number of changed rows
+        with open(filename, encoding = "utf-8") as infile:
+            header, *lines = infile.read().splitlines()
+
+        lines_now = {}
+        for line in lines:
+            if line:
+                lines_now[";".join(line.split(";", KEY_FIELDS)[:KEY_FIELDS])] = line
+        changed_keys = [key for key, line in lines_now.items() if self.lines.get(key) != line]
+        removed_keys = [key for key in self.lines if key not in lines_now]
+        self.lines = lines_now
+
+        vote_changes = {}
+        eligible_changes = {}
+        for key in removed_keys:
+            district, party, votes = self.votes.pop(key)
+            vote_changes[(district, party)] = vote_changes.get((district, party), 0) - votes
+
+        changed = pd.read_csv(io.StringIO("\n".join([header] + [lines_now[key] for key in changed_keys])),
+                              delimiter = ";", decimal = ",")
+        for key, district, party, votes, eligibles in zip(changed_keys,
+                                                          changed["Fylkenavn"],
+                                                          changed["Partikode"],
+                                                          changed["Antall stemmer totalt"].tolist(),
+                                                          changed["Antall stemmeberettigede"].tolist()):
+            _, _, votes_before = self.votes.get(key, (district, party, 0))
+            self.votes[key] = (district, party, votes)
+            if votes != votes_before:
+                vote_changes[(district, party)] = vote_changes.get((district, party), 0) + votes - votes_before
+
+            # the eligible voters are repeated on every row of a polling station
+            station = key.rsplit(";", KEY_FIELDS - STATION_FIELDS)[0]
+            _, eligibles_before = self.eligibles.get(station, (district, 0))
+            if eligibles != eligibles_before:
+                self.eligibles[station] = (district, eligibles)
+                eligible_changes[district] = eligible_changes.get(district, 0) + eligibles - eligibles_before
+
+        if removed_keys:
+            stations = {key.rsplit(";", KEY_FIELDS - STATION_FIELDS)[0] for key in lines_now}
+            for station in [station for station in self.eligibles if station not in stations]:
+                district, eligibles_before = self.eligibles.pop(station)
+                eligible_changes[district] = eligible_changes.get(district, 0) - eligibles_before
+
+        return vote_changes, eligible_changes, len(changed_keys) + len(removed_keys)
+
+
+class SnapshotWatcher:
+    # Follows a folder of result snapshots, and updates one election with
+    # the changes in every new snapshot instead of recalculating it from scratch
+    def __init__(self, args, folder, pattern = "*_partydist*.csv"):
+        self.args = args
+        self.folder = folder
+        self.pattern = pattern
+        self.reader = SnapshotReader()
+        self.norway = None
+        self._stats = {}
+        self._ingested = {}
+
+    def new_snapshots(self):
+        # files that are new or changed since they were last read, and have
+        # stopped changing since the previous check (so they are fully written)
+        ready = []
+        for filename in glob.glob(os.path.join(self.folder, self.pattern)):
+            stat = os.stat(filename)
+            stat = (stat.st_mtime_ns, stat.st_size)
+            settled = self._stats.get(filename) == stat
+            self._stats[filename] = stat
+            if settled and self._ingested.get(filename) != stat:
+                ready.append((stat[0], filename))
+        return [filename for _, filename in sorted(ready)]
+
+    def ingest(self, filename):
+        start_time = time.perf_counter()
+        vote_changes, eligible_changes, num_changed = self.reader.read(filename)
+        if self.norway is None or not self.norway.update_votes(vote_changes, eligible_changes):
+            self.norway = make_election(self.args, filename = filename)
+            self.norway.calculate(dist_method = self.args.method, num_seats = 169)
+        self._ingested[filename] = self._stats[filename]
+        duration = time.perf_counter() - start_time
+
+        print("")
+        print(f"{os.path.basename(filename)}: {num_changed} endrede rader, oppdatert på {duration:.4f}s")
+        if self.args.results:
+            self.norway.show_results()
+        else:
+            print(self.norway.distribution_table)
+
+        if self.args.plot:
+            import matplotlib.pyplot as plt
+            self.norway.plot_results(parliament_rows = 4)
+            plt.close("all")
+            print(f"Figurer lagret i {self.args.folder} ({time.perf_counter() - start_time:.2f}s)")
+
+    def watch(self, interval = 0.25, replay = False):
+        # the first check only records the files, the second finds the ones that are fully written
+        self.new_snapshots()
+        time.sleep(interval)
+        snapshots = self.new_snapshots()
+        if not replay:
+            # start from the latest snapshot already in the folder
+            for filename in snapshots[:-1]:
+                self._ingested[filename] = self._stats[filename]
+            snapshots = snapshots[-1:]
+        for filename in snapshots:
+            self.ingest(filename)
+
+        print(f"Venter på nye filer i {self.folder} ...")
+        while True:
+            time.sleep(interval)
+            for filename in self.new_snapshots():
+                self.ingest(filename)
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Follow a folder of result snapshots and update the results as new files arrive. Other arguments are passed on to election.py")
+    parser.add_argument("watchfolder",
+                        help = "Folder to watch for new results files",
+                        type = str)
+    parser.add_argument("--pattern",
+                        help = "File name pattern for the results files (default *_partydist*.csv)",
+                        default = "*_partydist*.csv",
+                        type = str)
+    parser.add_argument("--interval",
+                        help = "Seconds between each check for new files (default 0.25)",
+                        default = 0.25,
+                        type = float)
+    parser.add_argument("--replay",
+                        help = "Read all the files already in the folder in order, instead of starting from the latest one",
+                        action = "store_true")
+    watch_args, election_argv = parser.parse_known_args()
+    args = parse_args(election_argv)
+    if args.plot:
+        # the watcher can't stop for figure windows, so the figures are saved
+        import matplotlib
+        matplotlib.use("Agg")
+        args.saveplot = True
+
+    watcher = SnapshotWatcher(args, watch_args.watchfolder, pattern = watch_args.pattern)
+    try:
+        watcher.watch(interval = watch_args.interval, replay = watch_args.replay)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()